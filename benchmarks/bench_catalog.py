@@ -0,0 +1,57 @@
+"""
+memory report of the in-memory catalog and /perks resolution latency of the catalog compared to SQLite
+
+usage (from the repository root):
+    python benchmarks/bench_catalog.py [number of weapons]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import commandCallFunctions  # noqa: E402
+from catalog import get_catalog  # noqa: E402
+from readDB import manifest_pool  # noqa: E402
+
+
+async def time_resolution(weapon_names: list[str], catalog_enabled: bool) -> list[float]:
+    commandCallFunctions.CATALOG_ENABLED = catalog_enabled
+    timings: list[float] = []
+    for weapon_name in weapon_names:
+        start: float = time.perf_counter()
+        await commandCallFunctions.resolve_weapon(weapon_name)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    n_weapons: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    start: float = time.perf_counter()
+    catalog = get_catalog()
+    build_time: float = time.perf_counter() - start
+
+    report: dict[str, int] = catalog.memory_report()
+    print(f'catalog built in {build_time:.2f}s: {len(catalog.weapons)} weapons, {len(catalog.plug_sets)} plug sets, '
+          f'{len(catalog.perks)} perks')
+    for structure, size in report.items():
+        print(f'  {structure:<14}{size / 1024:>10.1f} KiB')
+    print(f'  {"total":<14}{sum(report.values()) / 1024:>10.1f} KiB')
+
+    cur = manifest_pool.get_connection().execute('SELECT display_name FROM WeaponNameIndex WHERE random_roll = 1')
+    names: list[str] = [row[0] for row in cur.fetchall()]
+    weapon_names: list[str] = random.Random(0).sample(names, min(n_weapons, len(names)))
+
+    print(f'\n{"path":<10}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}')
+    for path, enabled in (('sqlite', False), ('catalog', True)):
+        timings: list[float] = asyncio.run(time_resolution(weapon_names, enabled))
+        p99: float = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+        print(f'{path:<10}{statistics.mean(timings):>10.3f}{statistics.median(timings):>10.3f}{p99:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+cold start of the catalog: building it from the installed game database compared to loading the snapshot of it,
+in this process and in a fresh interpreter each (--processes), which includes importing the bot's modules
+
+usage (from the repository root):
+    python benchmarks/bench_catalog_startup.py [--runs 5] [--processes 3]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from catalog import CATALOG_SNAPSHOT_PATH, build_catalog, load_god_rolls, load_snapshot, save_snapshot  # noqa: E402
+from readDB import manifest_pool, curation_pool  # noqa: E402
+
+# run by a fresh interpreter; prints the milliseconds from the first import to a usable catalog
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+from catalog import build_catalog, load_god_rolls, load_snapshot
+from readDB import manifest_pool, curation_pool
+con = manifest_pool.get_connection()
+if {snapshot}:
+    catalog = load_snapshot(manifest_pool.version)
+    catalog.god_rolls = load_god_rolls(curation_pool.get_connection())
+else:
+    catalog = build_catalog(con, curation_pool.get_connection())
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def time_rebuild() -> float:
+    # fresh connections, so the page cache of the previous run does not help sqlite
+    manifest_pool.swap(version=manifest_pool.version)
+    curation_pool.swap()
+    start: float = time.perf_counter()
+    build_catalog(manifest_pool.get_connection(), curation_pool.get_connection())
+    return (time.perf_counter() - start) * 1000
+
+
+def time_snapshot() -> float:
+    start: float = time.perf_counter()
+    catalog = load_snapshot(manifest_pool.version)
+    catalog.god_rolls = load_god_rolls(curation_pool.get_connection())
+    return (time.perf_counter() - start) * 1000
+
+
+def time_process(snapshot: bool) -> float:
+    script: str = STARTUP_SCRIPT.format(src=SRC_DIR, snapshot=snapshot)
+    output: str = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+
+def print_row(path: str, timings: list[float]):
+    print(f'{path:<22}{statistics.mean(timings):>10.1f}{min(timings):>10.1f}{max(timings):>10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='in-process runs of each path')
+    parser.add_argument('--processes', type=int, default=3, help='fresh interpreter runs of each path, 0 skips them')
+    args = parser.parse_args()
+
+    built = build_catalog(manifest_pool.get_connection(), curation_pool.get_connection())
+    save_snapshot(built, manifest_pool.version)
+    loaded = load_snapshot(manifest_pool.version)
+    loaded.god_rolls = built.god_rolls
+    tables: tuple[str, ...] = ('names', 'weapons', 'plug_sets', 'perks', 'damage_types', 'god_rolls')
+    mismatched: list[str] = [table for table in tables if getattr(built, table) != getattr(loaded, table)]
+    print(f'snapshot of {manifest_pool.version}: {os.path.getsize(CATALOG_SNAPSHOT_PATH) / 1024:.1f} KiB, '
+          f'{len(built.weapons)} weapons, {len(built.perks)} perks; '
+          f'{"identical to the build" if not mismatched else "differs in " + ", ".join(mismatched)}')
+
+    print(f'\n{"path":<22}{"mean ms":>10}{"min ms":>10}{"max ms":>10}')
+    print_row('rebuild', [time_rebuild() for _ in range(args.runs)])
+    print_row('snapshot', [time_snapshot() for _ in range(args.runs)])
+    if args.processes:
+        print_row('rebuild, new process', [time_process(False) for _ in range(args.processes)])
+        print_row('snapshot, new process', [time_process(True) for _ in range(args.processes)])
+
+
+if __name__ == '__main__':
+    main()
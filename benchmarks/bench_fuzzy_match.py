@@ -0,0 +1,86 @@
+"""
+latency of misspelled weapon name lookups with the trigram index compared to a brute-force edit distance scan
+over all random rolled weapon names, and how often both rank the same name first
+
+usage (from the repository root):
+    python benchmarks/bench_fuzzy_match.py [number of queries]
+"""
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from manifestIndex import normalize_name  # noqa: E402
+from weaponSearch import WeaponSearchIndex, refresh_search_index  # noqa: E402
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous: list[int] = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current: list[int] = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def brute_force(names: list[str], text: str) -> str:
+    normalized_text: str = normalize_name(text)
+    return min(names, key=lambda name: edit_distance(normalized_text, normalize_name(name)))
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    chars: list[str] = list(name)
+    for _ in range(rng.randint(1, 2)):
+        i: int = rng.randrange(len(chars))
+        operation: int = rng.randrange(3)
+        if operation == 0 and len(chars) > 1:
+            del chars[i]
+        elif operation == 1:
+            chars.insert(i, rng.choice(string.ascii_lowercase))
+        else:
+            chars[i] = rng.choice(string.ascii_lowercase)
+    return ''.join(chars)
+
+
+def time_lookups(lookup, queries: list[str]) -> tuple[list[float], list[str]]:
+    timings: list[float] = []
+    results: list[str] = []
+    for query in queries:
+        start: float = time.perf_counter()
+        results.append(lookup(query))
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, results
+
+
+def main():
+    n_queries: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    start: float = time.perf_counter()
+    search_index: WeaponSearchIndex = refresh_search_index()
+    print(f'search index built in {time.perf_counter() - start:.3f}s over {len(search_index.names)} weapons')
+
+    rng: random.Random = random.Random(0)
+    targets: list[str] = [rng.choice(search_index.names) for _ in range(n_queries)]
+    queries: list[str] = [misspell(name, rng) for name in targets]
+
+    def trigram_lookup(query: str) -> str:
+        matches = search_index.find_similar(query, limit=1, min_similarity=0)
+        return matches[0][0] if matches else ''
+
+    print(f'\n{"path":<14}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}{"top-1 hit":>11}')
+    for path, lookup in (('trigram', trigram_lookup),
+                         ('edit distance', lambda query: brute_force(search_index.names, query))):
+        timings, results = time_lookups(lookup, queries)
+        p99: float = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+        hits: float = sum(result == target for result, target in zip(results, targets)) / len(targets)
+        print(f'{path:<14}{statistics.mean(timings):>10.3f}{statistics.median(timings):>10.3f}{p99:>10.3f}'
+              f'{hits:>11.1%}')
+
+
+if __name__ == '__main__':
+    main()
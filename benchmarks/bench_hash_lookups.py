@@ -0,0 +1,70 @@
+"""
+micro-benchmark comparing json_tree hash scans with primary-key lookups on a manifest database
+
+usage (from the repository root):
+    python benchmarks/bench_hash_lookups.py [path/to/Manifest.content] [repetitions]
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from readDB import hash_to_id  # noqa: E402
+
+TABLES = ['DestinyPlugSetDefinition', 'DestinyInventoryItemDefinition', 'DestinyDamageTypeDefinition']
+
+
+def json_tree_lookup(cur: sqlite3.Cursor, table: str, item_hash: int):
+    cur.execute(f"""
+        SELECT
+            json_extract({table}.json, '$')
+        FROM
+            {table}, json_tree({table}.json, '$')
+        WHERE
+            json_tree.key = 'hash' AND json_tree.value = ?""", (item_hash,))
+    return cur.fetchone()
+
+
+def primary_key_lookup(cur: sqlite3.Cursor, table: str, item_hash: int):
+    cur.execute(f'SELECT json FROM {table} WHERE id = ?', (hash_to_id(item_hash),))
+    return cur.fetchone()
+
+
+def sample_hashes(cur: sqlite3.Cursor, table: str, n: int) -> list[int]:
+    cur.execute(f"SELECT json_extract(json, '$.hash') FROM {table}")
+    hashes: list[int] = [row[0] for row in cur.fetchall()]
+    return random.Random(0).sample(hashes, min(n, len(hashes)))
+
+
+def main():
+    manifest_path: str = sys.argv[1] if len(sys.argv) > 1 else 'resources/Manifest.content'
+    repetitions: int = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    con = sqlite3.connect(manifest_path)
+    cur = con.cursor()
+
+    print(f'{"table":<34}{"rows":>8}{"json_tree ms":>15}{"primary key ms":>17}{"speedup":>10}')
+    for table in TABLES:
+        rows: int = cur.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        hashes: list[int] = sample_hashes(cur, table, repetitions)
+
+        for item_hash in hashes:
+            expected = json.loads(json_tree_lookup(cur, table, item_hash)[0])
+            assert expected == json.loads(primary_key_lookup(cur, table, item_hash)[0])
+
+        scan: float = timeit.timeit(lambda: [json_tree_lookup(cur, table, h) for h in hashes], number=1)
+        keyed: float = timeit.timeit(lambda: [primary_key_lookup(cur, table, h) for h in hashes], number=1)
+
+        scan_ms: float = scan / len(hashes) * 1000
+        keyed_ms: float = keyed / len(hashes) * 1000
+        print(f'{table:<34}{rows:>8}{scan_ms:>15.3f}{keyed_ms:>17.4f}{scan_ms / keyed_ms:>9.0f}x')
+
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+end-to-end benchmark of the /perks pipeline, timing every stage separately with cold and warm caches.
+
+cold: fresh database connections, an empty asset cache and no decoded icons before every stage
+warm: the same stage repeated right away with all caches kept
+
+The installed resources/Manifest.content is the snapshot measured; its md5 sum is part of the results, so only
+runs against the same snapshot are compared.
+
+usage (from the repository root):
+    python benchmarks/bench_pipeline.py [--weapons N] [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import commandCallFunctions  # noqa: E402
+from APIrequests import read_manifest_md5  # noqa: E402
+from assetCache import asset_cache, load_icon  # noqa: E402
+from assetFetcher import asset_fetcher, get_render_assets  # noqa: E402
+from createImages import compose_perk_image, encode_image  # noqa: E402
+from customExceptions import NoGodRollError  # noqa: E402
+from helperClasses import GodRollContainer, PlugSet  # noqa: E402
+from readDB import manifest_pool, curation_pool, query_god_roll, query_damage_type, query_plug_sets  # noqa: E402
+from readJSON import get_perk_plug_set_hashes, load_perks  # noqa: E402
+
+STAGES = ['name_lookup', 'plug_set_resolution', 'perk_resolution', 'curation', 'asset_fetch', 'compositing',
+          'encoding']
+RESULT_FORMAT_VERSION = 1
+
+
+def reset_caches(stage: str):
+    if stage in ('name_lookup', 'plug_set_resolution', 'perk_resolution', 'curation'):
+        manifest_pool.swap(version=manifest_pool.version)
+        curation_pool.swap()
+    elif stage == 'asset_fetch':
+        shutil.rmtree(asset_cache.directory, ignore_errors=True)
+        asset_cache.size = -1
+        asset_cache._failures.clear()
+    if stage in ('asset_fetch', 'compositing'):
+        load_icon.cache_clear()
+
+
+async def run_stages(weapon_name: str, record: Callable[[str, float], None], cold: bool):
+    """
+    runs the /perks pipeline for one weapon, passing the duration of every stage to record
+    """
+    async def timed(stage: str, func, *args):
+        if cold:
+            reset_caches(stage)
+        start: float = time.perf_counter()
+        result = func(*args)
+        if asyncio.iscoroutine(result):
+            result = await result
+        record(stage, (time.perf_counter() - start) * 1000)
+        return result
+
+    def resolve_curation(weapon, weapon_perks):
+        try:
+            GodRollContainer(query_god_roll(weapon.get_hash())).apply_to_perk_set(perk_set=weapon_perks)
+        except NoGodRollError:
+            pass
+
+    weapon = await timed('name_lookup', commandCallFunctions.find_weapon, weapon_name)
+
+    plug_set_hashes: list[int] = get_perk_plug_set_hashes(weapon.get_socket_set())
+    plug_sets: dict[int, str] = await timed('plug_set_resolution', query_plug_sets, plug_set_hashes)
+
+    perk_hashes: list[list[int]] = [PlugSet(plug_sets[plug_set_hash]).get_perk_hashes()
+                                    for plug_set_hash in plug_set_hashes]
+    weapon_perks = await timed('perk_resolution', load_perks, perk_hashes)
+
+    await timed('curation', resolve_curation, weapon, weapon_perks)
+
+    damage_type_icon: str = query_damage_type(weapon.get_damage_type())
+    failed: list[str] = await timed('asset_fetch', asset_fetcher.fetch_all,
+                                    get_render_assets(weapon, weapon_perks, damage_type_icon))
+    if failed:
+        raise RuntimeError(f'{len(failed)} assets of {weapon_name} could not be fetched')
+
+    image = await timed('compositing', compose_perk_image, weapon, weapon_perks, damage_type_icon)
+    await timed('encoding', encode_image, image)
+
+
+def summarize(timings: list[float]) -> dict[str, float]:
+    return {
+        'n': len(timings),
+        'mean_ms': statistics.mean(timings),
+        'p50_ms': statistics.median(timings),
+        'p95_ms': statistics.quantiles(timings, n=20)[18] if len(timings) > 1 else timings[0],
+        'min_ms': min(timings),
+        'max_ms': max(timings),
+    }
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(weapon_names: list[str]) -> dict[str, dict[str, list[float]]]:
+    timings: dict[str, dict[str, list[float]]] = {stage: {'cold': [], 'warm': []} for stage in STAGES}
+    for weapon_name in weapon_names:
+        for mode in ('cold', 'warm'):
+            await run_stages(weapon_name, lambda stage, ms: timings[stage][mode].append(ms), cold=mode == 'cold')
+    await asset_fetcher.close()
+    return timings
+
+
+def print_results(results: dict, baseline: Optional[dict]):
+    header: str = f'{"stage":<22}{"cold p50":>10}{"cold mean":>11}{"warm p50":>10}{"warm mean":>11}'
+    if baseline is not None:
+        header += f'{"cold vs base":>14}{"warm vs base":>14}'
+    print(header)
+    for stage in STAGES:
+        cold, warm = results['stages'][stage]['cold'], results['stages'][stage]['warm']
+        line: str = f'{stage:<22}{cold["p50_ms"]:>10.3f}{cold["mean_ms"]:>11.3f}{warm["p50_ms"]:>10.3f}' \
+                    f'{warm["mean_ms"]:>11.3f}'
+        if baseline is not None and stage in baseline['stages']:
+            for mode in ('cold', 'warm'):
+                ratio: float = results['stages'][stage][mode]['p50_ms'] / baseline['stages'][stage][mode]['p50_ms']
+                line += f'{ratio:>13.2f}x'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weapons', type=int, default=20, help='number of random rolled weapons to render')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the weapon sample')
+    parser.add_argument('--output', default='bench_pipeline.json', help='file to write the results to as json')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    cur = manifest_pool.get_connection().execute(
+        'SELECT DISTINCT display_name FROM WeaponNameIndex WHERE random_roll = 1 ORDER BY display_name')
+    names: list[str] = [row[0] for row in cur.fetchall()]
+    weapon_names: list[str] = random.Random(args.seed).sample(names, min(args.weapons, len(names)))
+
+    # measure against a scratch asset cache, the installed one stays untouched
+    asset_cache.directory = tempfile.mkdtemp(prefix='rahool-bench-assets-')
+    try:
+        timings = asyncio.run(benchmark(weapon_names))
+    finally:
+        shutil.rmtree(asset_cache.directory, ignore_errors=True)
+
+    results: dict = {
+        'format': RESULT_FORMAT_VERSION,
+        'commit': get_commit(),
+        'manifest_md5': read_manifest_md5(),
+        'catalog': commandCallFunctions.CATALOG_ENABLED,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'weapons': weapon_names,
+        'stages': {stage: {mode: summarize(values) for mode, values in modes.items()}
+                   for stage, modes in timings.items()},
+    }
+
+    baseline: Optional[dict] = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('manifest_md5') != results['manifest_md5']:
+            print('warning: baseline was measured against a different manifest snapshot', file=sys.stderr)
+
+    print_results(results, baseline)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'\nresults written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
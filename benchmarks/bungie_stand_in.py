@@ -0,0 +1,205 @@
+"""
+local stand-in for the parts of bungie.net rahool talks to, so updates and renders can be load tested offline:
+
+    /Platform/Destiny2/Manifest/                         manifest metadata pointing to the served game database
+    /common/destiny2_content/sqlite/en/<name>.content    the game database as zip archive, supports range requests
+    any path ending in .png or .jpg                      generated icon or screenshot, the same for the same path
+
+The game database is re-read whenever the file changes, so replacing it makes the bot install an update.
+
+usage (from the repository root):
+    python benchmarks/synthetic_manifest.py /tmp/Manifest.content --scale 10
+    python benchmarks/bungie_stand_in.py /tmp/Manifest.content [--port 8080] [--latency 0]
+    RAHOOL_BUNGIE_ROOT=http://127.0.0.1:8080 python src/rahool.py
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+import zipfile
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from PIL import Image, ImageDraw
+
+MANIFEST_ENDPOINT = '/Platform/Destiny2/Manifest/'
+CONTENT_PREFIX = '/common/destiny2_content/sqlite/en/'
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+@lru_cache(maxsize=256)
+def generate_asset(path: str) -> bytes:
+    """
+    :param path: bungie.net path of the asset
+    :return: a 1920x1080 JPEG for .jpg paths, a 96x96 PNG icon otherwise, derived from the path
+    """
+    rng: random.Random = random.Random(hashlib.md5(path.encode()).digest())
+    buffer = io.BytesIO()
+    if path.endswith('.jpg'):
+        image = Image.new('RGB', (1920, 1080), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(30):
+            x, y = rng.randrange(1920), rng.randrange(1080)
+            draw.ellipse((x, y, x + 300, y + 200), fill=tuple(rng.randrange(256) for _ in range(3)))
+        image.save(buffer, 'JPEG', quality=85)
+    else:
+        image = Image.new('RGBA', (96, 96), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((8, 8, 88, 88), fill=tuple(rng.randrange(256) for _ in range(3)) + (255,))
+        image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ManifestArchive:
+    """
+    Zips the served game database next to it and keeps track of its md5 sum, redone when the database changes.
+    """
+    path: str
+    zip_path: str
+    md5: Optional[str]
+
+    def __init__(self, path: str):
+        """
+        :param path: game database to serve
+        """
+        self.path = path
+        self.zip_path = f'{path}.zip'
+        self.md5 = None
+        self._stat: Optional[tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> str:
+        """
+        :return: md5 sum of the current game database
+        """
+        stat = os.stat(self.path)
+        with self._lock:
+            if (stat.st_mtime_ns, stat.st_size) != self._stat:
+                content_md5 = hashlib.md5()
+                with open(self.path, 'rb') as file:
+                    for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                        content_md5.update(chunk)
+                self.md5 = content_md5.hexdigest()
+
+                tmp_path: str = f'{self.zip_path}.part'
+                with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    archive.write(self.path, f'world_sql_content_{self.md5}.content')
+                os.replace(tmp_path, self.zip_path)
+                self._stat = (stat.st_mtime_ns, stat.st_size)
+            return self.md5
+
+    def get_content_path(self) -> str:
+        """
+        :return: bungie.net path of the game database, embedding its md5 sum like the real one
+        """
+        return f'{CONTENT_PREFIX}world_sql_content_{self.refresh()}.content'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    archive: ManifestArchive
+    latency: float = 0
+    # False answers range requests with the whole file, like servers without range support
+    ranges: bool = True
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+        path: str = self.path.split('?', 1)[0]
+        if path == MANIFEST_ENDPOINT:
+            body: bytes = json.dumps({'Response': {'mobileWorldContentPaths': {'en': self.archive.get_content_path()}},
+                                      'ErrorCode': 1}).encode()
+            self.send_body(body, 'application/json')
+        elif path.startswith(CONTENT_PREFIX) and path == self.archive.get_content_path():
+            self.send_file(self.archive.zip_path)
+        elif path.endswith(('.png', '.jpg')):
+            self.send_body(generate_asset(path), 'image/jpeg' if path.endswith('.jpg') else 'image/png')
+        else:
+            self.send_error(404)
+
+    def send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, path: str):
+        size: int = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = RANGE_PATTERN.fullmatch(self.headers.get('Range', ''))
+        if match and self.ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        with open(path, 'rb') as file:
+            file.seek(start)
+            remaining: int = end - start + 1
+            while remaining > 0:
+                chunk: bytes = file.read(min(1024 * 1024, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in(manifest_path: str, host: str = '127.0.0.1', port: int = 0, latency: float = 0,
+                   ranges: bool = True) -> tuple[ThreadingHTTPServer, str]:
+    """
+    serves the stand-in on a background thread
+
+    :param manifest_path: game database to serve
+    :param host: interface to listen on
+    :param port: port to listen on, 0 picks a free one
+    :param latency: seconds every response is delayed by
+    :param ranges: False ignores range requests
+    :return: the server, stop it with shutdown(), and its root url to set as RAHOOL_BUNGIE_ROOT
+    """
+    archive: ManifestArchive = ManifestArchive(manifest_path)
+    archive.refresh()
+    handler = type('Handler', (StandInHandler,), {'archive': archive, 'latency': latency, 'ranges': ranges})
+    server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='bungie-stand-in', daemon=True).start()
+    return server, f'http://{server.server_address[0]}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='game database to serve, e.g. generated by synthetic_manifest.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='seconds every response is delayed by')
+    parser.add_argument('--no-ranges', action='store_true', help='answer range requests with the whole file')
+    args = parser.parse_args()
+
+    server, root = start_stand_in(args.manifest, args.host, args.port, args.latency, not args.no_ranges)
+    print(f'serving {args.manifest} at {root}; set RAHOOL_BUNGIE_ROOT={root}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+load generator for the /perks command: drives the command handler of rahool.py with fake interactions that stand
+in for disnake's inter.response.defer and inter.followup.send, many at once, and reports throughput, latency
+percentiles and how late the event loop ran timers meanwhile.
+
+closed loop (default): --concurrency users, each sending its next request as soon as the previous one is answered
+open loop (--rate): requests arrive at random at the given average rate no matter how many are still unanswered
+
+The weapon mix is drawn from the random rolled weapons of the installed resources/Manifest.content: --distinct
+weapons, picked Zipf distributed with exponent --zipf (0 picks all equally often), a share of them misspelled
+(--typos) or not a weapon at all (--unknown).
+
+Assets are downloaded from bungie.net; to run offline start benchmarks/bungie_stand_in.py and set
+RAHOOL_BUNGIE_ROOT to its address.
+
+usage (from the repository root):
+    python benchmarks/load_perks.py [--concurrency 50] [--requests 1000] [--rate R] [--distinct 100] [--zipf 1.1]
+                                    [--typos 0.05] [--unknown 0.02] [--cold] [--output results.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import rahool  # noqa: E402
+from APIrequests import read_manifest_md5  # noqa: E402
+from assetFetcher import asset_fetcher  # noqa: E402
+from bench_pipeline import get_commit  # noqa: E402
+from catalog import CATALOG_ENABLED, get_catalog  # noqa: E402
+from metrics import start_metrics_server  # noqa: E402
+from readDB import manifest_pool  # noqa: E402
+from renderCache import render_cache  # noqa: E402
+from weaponSearch import refresh_search_index  # noqa: E402
+from workerPools import shutdown_pools  # noqa: E402
+
+RESULT_FORMAT_VERSION = 1
+# seconds between two event loop lag samples
+LAG_INTERVAL: float = 0.01
+
+
+class FakeResponse:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self.interaction = interaction
+
+    async def defer(self):
+        await asyncio.sleep(self.interaction.latency)
+        self.interaction.deferred_at = time.perf_counter()
+
+
+class FakeFollowup:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self.interaction = interaction
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        await asyncio.sleep(self.interaction.latency)
+        self.interaction.messages.append(kwargs)
+
+
+class FakeInteraction:
+    """
+    Records what the command handler answers instead of talking to Discord,
+    every call takes as long as a round trip to Discord would.
+    """
+    latency: float
+    deferred_at: Optional[float]
+    messages: list[dict]
+
+    def __init__(self, latency: float):
+        """
+        :param latency: seconds every call to Discord takes
+        """
+        self.latency = latency
+        self.deferred_at = None
+        self.messages = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    def get_outcome(self) -> str:
+        """
+        :return: 'image' if an image was sent, 'error_embed' if an error message was sent, 'no_answer' otherwise
+        """
+        if not self.messages:
+            return 'no_answer'
+        return 'image' if 'file' in self.messages[-1] else 'error_embed'
+
+
+class WeaponMix:
+    """
+    Draws the weapon names of the generated requests.
+    """
+    def __init__(self, names: list[str], zipf: float, typos: float, unknown: float, rng: random.Random):
+        """
+        :param names: weapon names, the first ones are requested most often
+        :param zipf: exponent of the Zipf distribution of the names, 0 picks all equally often
+        :param typos: share of requests with a misspelled name
+        :param unknown: share of requests for a name that is not a weapon
+        :param rng: random generator
+        """
+        self.names = names
+        self.cumulative_weights: list[float] = list(itertools.accumulate(1 / (rank + 1) ** zipf
+                                                                         for rank in range(len(names))))
+        self.typos = typos
+        self.unknown = unknown
+        self.rng = rng
+
+    def next(self) -> str:
+        roll: float = self.rng.random()
+        if roll < self.unknown:
+            return ''.join(self.rng.choices('bcdfghjklmnpqrstvwxz', k=self.rng.randint(5, 12)))
+        name: str = self.rng.choices(self.names, cum_weights=self.cumulative_weights)[0]
+        if roll < self.unknown + self.typos and len(name) > 3:
+            # swap two neighbouring letters
+            i: int = self.rng.randrange(len(name) - 1)
+            name = name[:i] + name[i + 1] + name[i] + name[i + 2:]
+        return name
+
+
+class LagMonitor:
+    """
+    Measures how much later than scheduled the event loop wakes up a sleeping task.
+    """
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        while True:
+            start: float = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def send_request(weapon_name: str, latency: float, results: list[dict]):
+    interaction: FakeInteraction = FakeInteraction(latency)
+    start: float = time.perf_counter()
+    outcome: str
+    try:
+        await rahool.perks.callback(interaction, weapon_name)
+        outcome = interaction.get_outcome()
+    except Exception as e:
+        outcome = f'exception:{type(e).__name__}'
+    results.append({
+        'weapon': weapon_name,
+        'outcome': outcome,
+        'latency_ms': (time.perf_counter() - start) * 1000,
+        'defer_ms': (interaction.deferred_at - start) * 1000 if interaction.deferred_at is not None else None,
+    })
+
+
+async def run_closed_loop(mix: WeaponMix, n_requests: int, concurrency: int, latency: float, results: list[dict]):
+    remaining = iter(range(n_requests))
+
+    async def user():
+        for _ in remaining:
+            await send_request(mix.next(), latency, results)
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+
+
+async def run_open_loop(mix: WeaponMix, n_requests: int, rate: float, latency: float, results: list[dict],
+                        rng: random.Random):
+    requests: list[asyncio.Task] = []
+    for _ in range(n_requests):
+        requests.append(asyncio.create_task(send_request(mix.next(), latency, results)))
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*requests)
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {'n': 0}
+    # quantiles need two data points, a single sample is every quantile of itself
+    quantiles: list[float] = statistics.quantiles(values * 2 if len(values) == 1 else values, n=100,
+                                                  method='inclusive')
+    return {
+        'n': len(values),
+        'mean_ms': statistics.mean(values),
+        'p50_ms': quantiles[49],
+        'p95_ms': quantiles[94],
+        'p99_ms': quantiles[98],
+        'max_ms': max(values),
+    }
+
+
+async def load_test(args, weapon_names: list[str]) -> tuple[list[dict], list[float], float]:
+    rng: random.Random = random.Random(args.seed)
+    mix: WeaponMix = WeaponMix(weapon_names, args.zipf, args.typos, args.unknown, rng)
+    if args.metrics_port:
+        await start_metrics_server(port=args.metrics_port)
+
+    results: list[dict] = []
+    monitor: LagMonitor = LagMonitor()
+    monitor.start()
+    start: float = time.perf_counter()
+    try:
+        if args.rate:
+            await run_open_loop(mix, args.requests, args.rate, args.discord_latency, results, rng)
+        else:
+            await run_closed_loop(mix, args.requests, args.concurrency, args.discord_latency, results)
+    finally:
+        duration: float = time.perf_counter() - start
+        await monitor.stop()
+        await asset_fetcher.close()
+
+    return results, [lag * 1000 for lag in monitor.lags], duration
+
+
+def print_results(results: dict):
+    print(f'{results["requests"]} requests in {results["duration_s"]:.2f}s: '
+          f'{results["throughput_rps"]:.1f} requests/s')
+    print(f'{"":<22}{"n":>7}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    rows: dict[str, dict] = {'latency': results['latency'], 'time to defer': results['defer'],
+                             'event loop lag': results['event_loop_lag']}
+    rows.update({f'  {outcome}': summary for outcome, summary in results['outcomes'].items()})
+    for label, summary in rows.items():
+        if summary['n'] == 0:
+            continue
+        print(f'{label:<22}{summary["n"]:>7}{summary["mean_ms"]:>10.1f}{summary["p50_ms"]:>10.1f}'
+              f'{summary["p95_ms"]:>10.1f}{summary["p99_ms"]:>10.1f}{summary["max_ms"]:>10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=50, help='simultaneous users of the closed loop')
+    parser.add_argument('--requests', type=int, default=1000, help='total number of requests')
+    parser.add_argument('--rate', type=float, help='average requests per second, switches to the open loop')
+    parser.add_argument('--distinct', type=int, default=100, help='number of different weapons requested')
+    parser.add_argument('--zipf', type=float, default=1.1, help='skew of the weapon popularity, 0 is uniform')
+    parser.add_argument('--typos', type=float, default=0.05, help='share of misspelled weapon names')
+    parser.add_argument('--unknown', type=float, default=0.02, help='share of names that are not a weapon')
+    parser.add_argument('--discord-latency', type=float, default=0.05,
+                        help='seconds every fake call to Discord takes')
+    parser.add_argument('--cold', action='store_true', help='disable the render cache, every request renders')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the weapon mix and arrivals')
+    parser.add_argument('--metrics-port', type=int, default=0, help='serve the bot metrics during the run')
+    parser.add_argument('--output', help='file to write the results to as json')
+    args = parser.parse_args()
+
+    # what the update loop does after a restart
+    refresh_search_index()
+    if CATALOG_ENABLED:
+        get_catalog()
+    if args.cold:
+        render_cache.max_bytes = 0
+
+    cur = manifest_pool.get_connection().execute(
+        'SELECT DISTINCT display_name FROM WeaponNameIndex WHERE random_roll = 1 ORDER BY display_name')
+    names: list[str] = [row[0] for row in cur.fetchall()]
+    weapon_names: list[str] = random.Random(args.seed).sample(names, min(args.distinct, len(names)))
+
+    try:
+        requests, lags, duration = asyncio.run(load_test(args, weapon_names))
+    finally:
+        shutdown_pools()
+
+    outcomes: dict[str, list[float]] = {}
+    for request in requests:
+        outcomes.setdefault(request['outcome'], []).append(request['latency_ms'])
+    results: dict = {
+        'format': RESULT_FORMAT_VERSION,
+        'commit': get_commit(),
+        'manifest_md5': read_manifest_md5(),
+        'catalog': CATALOG_ENABLED,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'parameters': vars(args),
+        'requests': len(requests),
+        'duration_s': duration,
+        'throughput_rps': len(requests) / duration,
+        'latency': summarize([request['latency_ms'] for request in requests]),
+        'defer': summarize([request['defer_ms'] for request in requests if request['defer_ms'] is not None]),
+        'event_loop_lag': summarize(lags),
+        'outcomes': {outcome: summarize(values) for outcome, values in sorted(outcomes.items())},
+    }
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'\nresults written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
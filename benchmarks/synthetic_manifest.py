@@ -0,0 +1,229 @@
+"""
+generates a synthetic game database with the tables, columns and json layout rahool reads from the real
+Manifest.content: random rolled and fixed weapons with perk sockets, plug sets, perks including enhanced and
+origin traits, damage types and unrelated filler items. Optionally generates matching curated rolls.
+
+--scale 1 roughly matches the item count of the live manifest; --scale 10 is ten times as large.
+
+usage (from the repository root):
+    python benchmarks/synthetic_manifest.py OUTPUT [--scale 1] [--seed 0] [--curation CurationRolls.db]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from helperClasses import ORIGIN_TRAIT_HASH, ENHANCED_PERK  # noqa: E402
+from readDB import hash_to_id  # noqa: E402
+
+# item counts at --scale 1
+BASE_COUNTS = {
+    'random_weapons': 1600,
+    'fixed_weapons': 600,
+    'perks_per_kind': 300,
+    'plug_sets_per_kind': 250,
+    'filler_items': 25000,
+}
+TABLES = ['DestinyInventoryItemDefinition', 'DestinyPlugSetDefinition', 'DestinyDamageTypeDefinition']
+DAMAGE_TYPES = ['Kinetic', 'Arc', 'Solar', 'Void', 'Raid', 'Stasis', 'Strand']
+WEAPON_TYPES = ['Auto Rifle', 'Hand Cannon', 'Pulse Rifle', 'Scout Rifle', 'Sidearm', 'Submachine Gun', 'Bow',
+                'Shotgun', 'Sniper Rifle', 'Fusion Rifle', 'Grenade Launcher', 'Rocket Launcher', 'Sword',
+                'Machine Gun', 'Trace Rifle', 'Glaive']
+# perk kinds of the four random perk columns
+PERK_KINDS = ['Barrel', 'Magazine', 'Trait', 'Trait']
+NAME_WORDS = ['Astral', 'Horizon', 'Bottom', 'Dollar', 'Shepherd', 'Watch', 'Grid', 'Skipper', 'Thought', 'Less',
+              'Fate', 'Bringer', 'Palindrome', 'Austringer', 'Midnight', 'Coup', 'Hung', 'Jury', 'Vex', 'Horror',
+              'Story', 'Dead', 'Tale', 'Ikelos', 'Mind', 'Bender', 'Ambition', 'Calus', 'Mini', 'Tool', 'Funnel',
+              'Web', 'Iron', 'Banner', 'Gnawing', 'Hunger', 'Crimil', 'Dagger', 'Eyasluna', 'Fixed', 'Odds',
+              'Rose', 'Thorn', 'Ace', 'Spades', 'Night', 'Hawk', 'Ever', 'Lasting', 'Piece', 'Main', 'Recluse']
+
+
+class HashSource:
+    """
+    hands out unique random 32 bit hashes
+    """
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.used: set[int] = {ORIGIN_TRAIT_HASH}
+
+    def next(self) -> int:
+        while True:
+            item_hash: int = self.rng.randrange(1, 2**32)
+            if item_hash not in self.used:
+                self.used.add(item_hash)
+                return item_hash
+
+
+def icon_path(item_hash: int) -> str:
+    return f'/common/destiny2_content/icons/{item_hash:08x}.png'
+
+
+def weapon_name(rng: random.Random, i: int) -> str:
+    name: str = ' '.join(rng.sample(NAME_WORDS, rng.choice((1, 2, 2, 3))))
+    # word combinations repeat at larger scales, numbered names keep most of them distinct
+    return name if i < len(NAME_WORDS) ** 2 else f'{name} {i // len(NAME_WORDS) ** 2}'
+
+
+def generate(path: str, scale: float = 1.0, seed: int = 0, curation_path: Optional[str] = None) -> dict[str, int]:
+    """
+    :param path: file to write the game database to, replaced if it exists
+    :param scale: multiplier of all item counts
+    :param seed: seed of the random generator, equal seeds and scales produce equal databases
+    :param curation_path: file to write curated rolls of a third of the random rolled weapons to
+    :return: number of rows written per table
+    """
+    counts: dict[str, int] = {key: max(1, int(count * scale)) for key, count in BASE_COUNTS.items()}
+    rng: random.Random = random.Random(seed)
+    hashes: HashSource = HashSource(rng)
+
+    items: list[tuple[int, str]] = []
+    plug_sets: list[tuple[int, str]] = []
+    damage_types: list[tuple[int, str]] = []
+
+    def add(rows: list[tuple[int, str]], definition: dict):
+        rows.append((hash_to_id(definition['hash']), json.dumps(definition)))
+
+    damage_type_hashes: list[int] = []
+    for name in DAMAGE_TYPES:
+        damage_type_hashes.append(hashes.next())
+        add(damage_types, {'hash': damage_type_hashes[-1], 'index': len(damage_type_hashes),
+                           'displayProperties': {'name': name, 'icon': icon_path(damage_type_hashes[-1])}})
+
+    def add_perk(kind: str, name: str) -> int:
+        perk_hash: int = hashes.next()
+        add(items, {'hash': perk_hash, 'itemType': 19, 'itemTypeDisplayName': kind, 'inventory': {'tierType': 2},
+                    'displayProperties': {'name': name, 'icon': icon_path(perk_hash),
+                                          'description': f'Synthetic {kind.lower()} {name}.'}})
+        return perk_hash
+
+    perks: dict[str, list[int]] = {}
+    enhanced: dict[int, int] = {}
+    for kind in ('Barrel', 'Magazine', 'Trait', 'Origin Trait'):
+        perks[kind] = []
+        for i in range(counts['perks_per_kind']):
+            perks[kind].append(add_perk(kind, f'{kind} {i}'))
+            if kind == 'Trait' and i % 3 == 0:
+                enhanced[perks[kind][-1]] = add_perk(ENHANCED_PERK, f'{kind} {i} Enhanced')
+
+    plug_set_hashes: dict[str, list[int]] = {}
+    for kind in ('Barrel', 'Magazine', 'Trait', 'Origin Trait'):
+        plug_set_hashes[kind] = []
+        for _ in range(counts['plug_sets_per_kind']):
+            plug_items: list[dict] = []
+            size: int = rng.randint(2, 3) if kind == 'Origin Trait' else rng.randint(4, 9)
+            for perk_hash in rng.sample(perks[kind], size):
+                plug_items.append({'plugItemHash': perk_hash, 'currentlyCanRoll': rng.random() > 0.1})
+                if perk_hash in enhanced and rng.random() < 0.5:
+                    plug_items.append({'plugItemHash': enhanced[perk_hash], 'currentlyCanRoll': True})
+            plug_set_hashes[kind].append(hashes.next())
+            add(plug_sets, {'hash': plug_set_hashes[kind][-1], 'reusablePlugItems': plug_items})
+
+    random_weapons: list[tuple[int, list[int]]] = []
+    for i in range(counts['random_weapons'] + counts['fixed_weapons']):
+        random_roll: bool = i < counts['random_weapons']
+        exotic: bool = rng.random() < 0.1
+        weapon_hash: int = hashes.next()
+
+        socket_entries: list[dict] = [{'socketTypeHash': 1, 'singleInitialItemHash': hashes.next()}]
+        columns: list[int] = []
+        for kind in PERK_KINDS:
+            plug_set_hash: int = rng.choice(plug_set_hashes[kind])
+            columns.append(plug_set_hash)
+            key: str = 'randomizedPlugSetHash' if random_roll and not exotic else 'reusablePlugSetHash'
+            socket_entries.append({'socketTypeHash': 2, key: plug_set_hash})
+        socket_entries.append({'socketTypeHash': ORIGIN_TRAIT_HASH,
+                               'reusablePlugSetHash': rng.choice(plug_set_hashes['Origin Trait'])})
+        # masterwork and mod sockets
+        socket_entries += [{'socketTypeHash': 3}, {'socketTypeHash': 4}]
+
+        name: str = weapon_name(rng, i % counts['random_weapons'])
+        add(items, {
+            'hash': weapon_hash,
+            'itemType': 3,
+            'itemTypeDisplayName': rng.choice(WEAPON_TYPES),
+            'itemTypeAndTierDisplayName': f'{"Exotic" if exotic else "Legendary"} {rng.choice(WEAPON_TYPES)}',
+            'collectibleHash': hashes.next(),
+            'screenshot': f'/common/destiny2_content/screenshots/{weapon_hash}.jpg',
+            'defaultDamageTypeHash': rng.choice(damage_type_hashes),
+            'displayProperties': {'name': name, 'icon': icon_path(weapon_hash), 'description': ''},
+            'inventory': {'tierType': 6 if exotic else 5},
+            'sockets': {'socketEntries': socket_entries,
+                        'socketCategories': [{'socketCategoryHash': 1, 'socketIndexes': [0]},
+                                             {'socketCategoryHash': 2, 'socketIndexes': [1, 2, 3, 4, 5]},
+                                             {'socketCategoryHash': 3, 'socketIndexes': [6, 7]}]},
+        })
+        if random_roll and not exotic:
+            random_weapons.append((weapon_hash, columns))
+
+    for i in range(counts['filler_items']):
+        filler_hash: int = hashes.next()
+        add(items, {'hash': filler_hash, 'itemType': rng.choice((0, 2, 9, 12, 14, 26)),
+                    'itemTypeDisplayName': 'Item', 'itemTypeAndTierDisplayName': 'Common Item',
+                    'displayProperties': {'name': f'Item {i}' if i % 4 else '', 'icon': icon_path(filler_hash),
+                                          'description': 'Synthetic filler item. ' * rng.randint(1, 8)}})
+
+    if os.path.exists(path):
+        os.remove(path)
+    con = sqlite3.connect(path)
+    try:
+        with con:
+            for table, rows in zip(TABLES, (items, plug_sets, damage_types)):
+                con.execute(f'CREATE TABLE {table} (id INTEGER PRIMARY KEY NOT NULL, json BLOB)')
+                con.executemany(f'INSERT INTO {table} VALUES (?, ?)', rows)
+    finally:
+        con.close()
+
+    if curation_path is not None:
+        write_curation(curation_path, rng, random_weapons, dict(plug_sets))
+
+    return {table: len(rows) for table, rows in zip(TABLES, (items, plug_sets, damage_types))}
+
+
+def write_curation(path: str, rng: random.Random, weapons: list[tuple[int, list[int]]], plug_sets: dict[int, str]):
+    """
+    writes curated pve and pvp rolls for a third of the random rolled weapons in the CurationRolls.db layout
+    """
+    rows: list[tuple[int, str]] = []
+    for weapon_hash, columns in weapons[::3]:
+        rolls: dict[str, list[list[str]]] = {}
+        for mode in ('PVE', 'PVP'):
+            rolls[mode] = []
+            for plug_set_hash in columns:
+                perk_hashes: list[int] = [item['plugItemHash'] for item in
+                                          json.loads(plug_sets[hash_to_id(plug_set_hash)])['reusablePlugItems']]
+                rolls[mode].append([str(perk_hash) for perk_hash in rng.sample(perk_hashes, min(2, len(perk_hashes)))])
+        rows.append((weapon_hash, json.dumps({'hash': str(weapon_hash), **rolls})))
+
+    if os.path.exists(path):
+        os.remove(path)
+    con = sqlite3.connect(path)
+    try:
+        with con:
+            con.execute('CREATE TABLE "Weapons" ("hash" INTEGER NOT NULL, "json" BLOB NOT NULL, PRIMARY KEY("hash"))')
+            con.executemany('INSERT INTO Weapons VALUES (?, ?)', rows)
+    finally:
+        con.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help='file to write the game database to')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of all item counts')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    parser.add_argument('--curation', help='file to write matching curated rolls to')
+    args = parser.parse_args()
+
+    start: float = time.perf_counter()
+    rows: dict[str, int] = generate(args.output, args.scale, args.seed, args.curation)
+    print(f'generated {args.output} ({os.path.getsize(args.output) / 2**20:.1f} MiB) in '
+          f'{time.perf_counter() - start:.1f}s: {rows}')
+
+
+if __name__ == '__main__':
+    main()
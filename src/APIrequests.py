@@ -1,88 +1,319 @@
+import hashlib
 import requests
+import shutil
+import sqlite3
+import threading
 import zipfile
 import logging
 import os
+from typing import Optional
+from manifestIndex import build_weapon_index, update_weapon_index, has_weapon_index, ManifestDiff
+from customExceptions import InvalidManifestError
 
 
 HEADERS = {"X-API-Key": os.environ.get('BUNGIE_API_KEY')}
-BASE_URL = 'http://www.bungie.net/Platform/Destiny2/Manifest/'
+# overridable to run against a local stand-in of bungie.net, see benchmarks/bungie_stand_in.py
+BUNGIE_ROOT = os.environ.get('RAHOOL_BUNGIE_ROOT', 'https://www.bungie.net')
+BASE_URL = f'{BUNGIE_ROOT}/Platform/Destiny2/Manifest/'
 HALF_HOUR = 1800
+MANIFEST_PATH = 'resources/Manifest.content'
+MANIFEST_MD5_PATH = 'resources/manifest_md5.txt'
+STAGING_DIR = 'resources/staging'
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = (10, 60)
+REQUIRED_TABLES = ['DestinyInventoryItemDefinition', 'DestinyPlugSetDefinition', 'DestinyDamageTypeDefinition']
 
+# serializes manifest installs of the update loop and of a first query on a fresh deployment
+install_lock = threading.Lock()
 
-# get destiny 2 game Manifest from the Bungie api
-def get_manifest():
-    """
-    gets manifest database from Bungie and sets it up under 'resources/Manifest.content'
 
+# get the location of the current destiny 2 game Manifest from the Bungie api
+def get_manifest_path() -> str:
+    """
+    :return: path of the current english game database on bungie.net
     :raises requests.exceptions.RequestException: if GET request fails
     """
-    manifest_url = BASE_URL
-
-    # get manifest location
     try:
-        r = requests.get(manifest_url, headers=HEADERS)
+        r = requests.get(BASE_URL, headers=HEADERS)
     except requests.exceptions.RequestException as e:
         logging.error(f'request failed, reason {e}')
         raise e
 
     manifest: dict = r.json()
-    mani_url: str = 'https://www.bungie.net' + manifest['Response']['mobileWorldContentPaths']['en']
+    return manifest['Response']['mobileWorldContentPaths']['en']
+
+
+def get_manifest_md5(manifest_path: str) -> str:
+    """
+    :param manifest_path: path of the game database on bungie.net
+    :return: md5 sum embedded in the path
+    """
+    md5_data: list[str] = manifest_path.split('_')
+    return md5_data[4].replace('.content', '')
+
+
+# get destiny 2 game Manifest from the Bungie api
+def get_manifest():
+    """
+    gets manifest database from Bungie, sets it up under 'resources/Manifest.content' and builds its derived index
+
+    :raises requests.exceptions.RequestException: if GET request fails
+    :raises InvalidManifestError: if the downloaded database is unusable
+    """
+    manifest_path: str = get_manifest_path()
+    install_manifest(manifest_path, get_manifest_md5(manifest_path))
+
+
+def download_manifest(manifest_path: str, staging_dir: str, md5: str) -> str:
+    """
+    streams the zipped game database to disk, resuming a partial download left in the staging directory,
+    and extracts it into the staging directory after checking it against its md5 sum
+
+    :param manifest_path: path of the game database on bungie.net
+    :param staging_dir: directory to download and extract to
+    :param md5: md5 sum embedded in manifest_path
+    :return: path of the extracted database
+    :raises requests.exceptions.RequestException: if GET request fails
+    :raises InvalidManifestError: if the download does not match its md5 sum
+    """
+    zip_path: str = os.path.join(staging_dir, 'MANZIP.part')
+    download_file(BUNGIE_ROOT + manifest_path, zip_path)
+    logging.info('manifest downloaded')
+
+    zip_md5: str = file_md5(zip_path)
+    db_path: str = os.path.join(staging_dir, 'Manifest.content')
+    try:
+        content_md5: str = extract_manifest(zip_path, db_path)
+    except zipfile.BadZipFile as e:
+        os.remove(zip_path)
+        raise InvalidManifestError(f'bad archive: {e}')
+    os.remove(zip_path)
+
+    # the md5 sum in the path may refer to either the archive or the database it contains
+    if md5 not in (zip_md5, content_md5):
+        raise InvalidManifestError(f'md5 mismatch; expected {md5}, archive {zip_md5}, content {content_md5}')
+
+    return db_path
+
+
+def download_file(url: str, path: str):
+    """
+    streams a file to disk in chunks, continuing where an earlier attempt left off if possible
+
+    :param url: location of the file
+    :param path: file to write to
+    :raises requests.exceptions.RequestException: if GET request fails
+    """
+    offset: int = os.path.getsize(path) if os.path.isfile(path) else 0
+    headers: dict = {'Range': f'bytes={offset}-'} if offset > 0 else {}
 
-    # Download file and write it to MANZIP
     try:
-        r = requests.get(mani_url)
+        with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+            if r.status_code == 416:
+                # the partial download is already complete
+                return
+            r.raise_for_status()
+
+            mode: str = 'ab' if r.status_code == 206 else 'wb'
+            if offset > 0:
+                logging.info(f'resuming download at {offset} bytes' if mode == 'ab' else 'server ignored resume request')
+            with open(path, mode) as file:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    file.write(chunk)
     except requests.exceptions.RequestException as e:
         logging.error(f'request failed, reason {e}')
         raise
-    with open('resources/MANZIP', 'wb') as zip:
-        zip.write(r.content)
-    logging.info('manifest downloaded')
 
-    # Extract the file contents, rename extracted file
-    with zipfile.ZipFile('resources/MANZIP') as zip:
-        name = zip.namelist()
-        zip.extractall()
 
-    os.rename(name[0], 'resources/Manifest.content')
+def extract_manifest(zip_path: str, db_path: str) -> str:
+    """
+    streams the first member of the archive to db_path
+
+    :param zip_path: path of the zipped game database
+    :param db_path: path to extract the database to
+    :return: md5 sum of the extracted database
+    :raises zipfile.BadZipFile: if the archive is corrupt
+    """
+    content_md5 = hashlib.md5()
+    with zipfile.ZipFile(zip_path) as zip:
+        with zip.open(zip.namelist()[0]) as src, open(db_path, 'wb') as dst:
+            while chunk := src.read(CHUNK_SIZE):
+                content_md5.update(chunk)
+                dst.write(chunk)
+    return content_md5.hexdigest()
+
+
+def file_md5(path: str) -> str:
+    """
+    :param path: file to hash
+    :return: md5 sum of the file
+    """
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        while chunk := file.read(CHUNK_SIZE):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def validate_manifest(db_path: str):
+    """
+    checks that a staged game database is intact and contains every table /perks relies on
+
+    :param db_path: path of the staged database
+    :raises InvalidManifestError: if the database is corrupt or incomplete
+    """
+    try:
+        con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        try:
+            check: str = con.execute('PRAGMA quick_check').fetchone()[0]
+            if check != 'ok':
+                raise InvalidManifestError(f'integrity check failed: {check}')
+            for table in REQUIRED_TABLES:
+                if con.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() is None:
+                    raise InvalidManifestError(f'table {table} is empty')
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        raise InvalidManifestError(str(e))
+
+
+def install_manifest(manifest_path: str, md5: str):
+    """
+    stages, validates and indexes a game database under a versioned path, then atomically replaces
+    'resources/Manifest.content' with it, so readers never see a missing or half-written database
+
+    :param manifest_path: path of the game database on bungie.net
+    :param md5: md5 sum of the game database
+    :raises requests.exceptions.RequestException: if GET request fails
+    :raises InvalidManifestError: if the downloaded database is unusable
+    """
+    with install_lock:
+        if os.path.isfile(MANIFEST_PATH) and read_manifest_md5() == md5:
+            logging.info(f'manifest {md5} already installed')
+            return
+
+        staging_dir: str = os.path.join(STAGING_DIR, md5)
+        clear_staging(keep=md5)
+        os.makedirs(staging_dir, exist_ok=True)
+        # a failed download stays in the staging directory and is resumed by the next attempt
+        try:
+            staged_path: str = download_manifest(manifest_path, staging_dir, md5)
+            validate_manifest(staged_path)
+            diff: Optional[ManifestDiff] = index_manifest(staged_path)
+        except InvalidManifestError as e:
+            logging.error(f'manifest {md5} rejected: {e}')
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        os.replace(staged_path, MANIFEST_PATH)
+        write_manifest_md5(md5)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    # let pooled readers reopen the replaced file
+    from readDB import manifest_pool
+    manifest_pool.swap(version=md5)
     logging.info('manifest ready')
 
+    refresh_derived_data(diff)
 
-# checks if a more recent Manifest exists, calls update if needed
-def check_update():
+
+def index_manifest(staged_path: str) -> Optional[ManifestDiff]:
     """
-    compares md5 sum of local game database with the one currently provided by Bungie. Updates when different.
+    builds the derived index of a staged game database, incrementally if an indexed database is installed
+
+    :param staged_path: path of the staged database
+    :return: differences to the installed database, None if the index was built from scratch
     """
-    if not os.path.isfile(r'resources/Manifest.content'):
-        get_manifest()
+    if os.path.isfile(MANIFEST_PATH):
+        try:
+            con = sqlite3.connect(f'file:{MANIFEST_PATH}?mode=ro', uri=True)
+            try:
+                incremental: bool = has_weapon_index(con)
+            finally:
+                con.close()
+            if incremental:
+                diff: ManifestDiff = update_weapon_index(staged_path, MANIFEST_PATH)
+                changed: list[str] = sorted(diff.changed_weapons.values())
+                logging.info(f'{len(changed)} weapons changed: {", ".join(changed[:50])}'
+                             f'{" ..." if len(changed) > 50 else ""}')
+                return diff
+        except sqlite3.Error as e:
+            logging.warning(f'incremental index update failed, rebuilding: {e}')
+
+    build_weapon_index(staged_path)
+    return None
+
+
+def refresh_derived_data(diff: Optional[ManifestDiff]):
+    """
+    updates in-memory structures derived from the game database after a new one was installed
+
+    :param diff: differences to the previously installed database, None if unknown
+    """
+    from catalog import refresh_catalog
+    from renderCache import render_cache
+    from weaponSearch import refresh_search_index
+    from perkAtlas import ensure_perk_atlas
+    refresh_catalog(diff)
+    refresh_search_index()
+    render_cache.carry_over(diff)
+    try:
+        ensure_perk_atlas()
+    except (OSError, sqlite3.Error) as e:
+        # renders fall back to the separately downloaded icons
+        logging.error(f'perk atlas build failed: {e}')
+
+
+def clear_staging(keep: str):
+    """
+    removes leftover staging directories of other manifest versions
+
+    :param keep: md5 sum of the version to keep
+    """
+    if not os.path.isdir(STAGING_DIR):
         return
+    for entry in os.listdir(STAGING_DIR):
+        if entry != keep:
+            shutil.rmtree(os.path.join(STAGING_DIR, entry), ignore_errors=True)
+
+
+def read_manifest_md5() -> str:
+    """
+    :return: md5 sum of the installed game database
+    """
+    with open(MANIFEST_MD5_PATH, 'r') as manifest_md5_hash:
+        return manifest_md5_hash.read()
+
 
-    manifest_url: str = BASE_URL
+def write_manifest_md5(md5: str):
+    """
+    :param md5: md5 sum of the installed game database
+    """
+    with open(MANIFEST_MD5_PATH, 'w') as manifest_md5_hash:
+        manifest_md5_hash.write(md5)
 
-    r = requests.get(manifest_url, headers=HEADERS)
-    manifest_info: dict = r.json()
 
-    md5_data: str = (manifest_info['Response']['mobileWorldContentPaths']['en']).split('_')
-    new_md5: str = md5_data[4].replace('.content', '')
+# checks if a more recent Manifest exists, calls update if needed
+def check_update() -> bool:
+    """
+    compares md5 sum of local game database with the one currently provided by Bungie. Updates when different.
+    Blocks on network and disk I/O; run it off the event loop.
 
-    manifest_md5_hash = open("resources/manifest_md5.txt", 'r')
-    old_hash = manifest_md5_hash.read()
-    manifest_md5_hash.close()
+    :return: True if a new game database was installed, False if not
+    """
+    if not os.path.isfile(MANIFEST_PATH):
+        get_manifest()
+        return True
+
+    manifest_path: str = get_manifest_path()
+    new_md5: str = get_manifest_md5(manifest_path)
+    old_hash: str = read_manifest_md5()
 
     logging.info(f'compare manifest md5 sum; old: {old_hash} new: {new_md5}')
 
     if not old_hash == new_md5:
         logging.info('md5 sums unequal; commence update')
-        manifest_md5_hash = open("resources/manifest_md5.txt", "w")
-        manifest_md5_hash.write(new_md5)
-        manifest_md5_hash.close()
-        update_manifest()
-
+        install_manifest(manifest_path, new_md5)
+        return True
 
-# updates the manifest
-def update_manifest():
-    """
-    removes old game database and calls get_manifest()
-    """
-    os.remove("resources/Manifest.content")
-    logging.info('old manifest removed')
-    get_manifest()
+    return False
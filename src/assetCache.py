@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from functools import lru_cache
+from typing import Optional
+from PIL import Image
+
+BUNGIE_ROOT = os.environ.get('RAHOOL_BUNGIE_ROOT', 'https://bungie.net')
+ASSET_CACHE_DIR = 'resources/asset_cache'
+ASSET_CACHE_MAX_BYTES: int = int(os.environ.get('RAHOOL_ASSET_CACHE_MB', 512)) * 1024 * 1024
+DOWNLOAD_TIMEOUT: float = float(os.environ.get('RAHOOL_FETCH_TIMEOUT', 5))
+FAILURE_TTL: float = 60
+# seconds after which the size of the cache is counted on disk again, other processes write to it too
+RECOUNT_INTERVAL: float = 60
+# seconds after which a temporary file is considered left behind by a crashed writer
+PART_FILE_TTL: float = 3600
+DECODED_ICON_CACHE_SIZE: int = int(os.environ.get('RAHOOL_ICON_CACHE_SIZE', 4096))
+
+
+class AssetCache:
+    """
+    On-disk cache of bungie.net images keyed by their path, evicting the least recently used files
+    once the cache outgrows its size limit.
+    """
+    directory: str
+    max_bytes: int
+    size: int
+
+    def __init__(self, directory: str = ASSET_CACHE_DIR, max_bytes: int = ASSET_CACHE_MAX_BYTES):
+        """
+        :param directory: directory to store cached files in
+        :param max_bytes: size limit of the cache
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = -1
+        self._counted_at: float = float('-inf')
+        self._failures: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get_cache_path(self, path: str) -> str:
+        """
+        :param path: bungie.net path of the asset
+        :return: location of the cached file, whether or not it exists
+        """
+        extension: str = os.path.splitext(path)[1][:8]
+        return os.path.join(self.directory, hashlib.sha1(path.encode()).hexdigest() + extension)
+
+    def get(self, path: str) -> str:
+        """
+        gets an asset from the cache, downloading it on a miss
+
+        :param path: bungie.net path of the asset
+        :return: location of the cached file
+        :raises urllib.error.URLError: if the download fails
+        :raises FileNotFoundError: if the download failed less than FAILURE_TTL seconds ago
+        """
+        cache_path: Optional[str] = self.lookup(path)
+        if cache_path is not None:
+            return cache_path
+
+        if time.monotonic() - self._failures.get(path, float('-inf')) < FAILURE_TTL:
+            raise FileNotFoundError(f'{path} failed to download recently')
+
+        return self.put(path, self.download(path))
+
+    def lookup(self, path: str) -> Optional[str]:
+        """
+        gets an asset from the cache without downloading it on a miss
+
+        :param path: bungie.net path of the asset
+        :return: location of the cached file, None on a miss
+        """
+        cache_path: str = self.get_cache_path(path)
+        try:
+            # refresh the access time used for eviction
+            os.utime(cache_path)
+            return cache_path
+        except FileNotFoundError:
+            return None
+
+    def mark_failed(self, path: str):
+        """
+        makes get() fail fast for an asset whose download just failed, instead of retrying it
+
+        :param path: bungie.net path of the asset
+        """
+        self._failures[path] = time.monotonic()
+
+    def contains(self, path: str) -> bool:
+        """
+        :param path: bungie.net path of the asset
+        :return: True if the asset is cached, False if it isn't
+        """
+        return os.path.isfile(self.get_cache_path(path))
+
+    def download(self, path: str) -> bytes:
+        """
+        :param path: bungie.net path of the asset
+        :return: the asset's content
+        :raises urllib.error.URLError: if the download fails
+        """
+        with urllib.request.urlopen(f'{BUNGIE_ROOT}{path}', timeout=DOWNLOAD_TIMEOUT) as response:
+            return response.read()
+
+    def put(self, path: str, content: bytes) -> str:
+        """
+        stores an asset, replacing the cached file atomically
+
+        :param path: bungie.net path of the asset
+        :param content: the asset's content
+        :return: location of the cached file
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        cache_path: str = self.get_cache_path(path)
+
+        try:
+            replaced: int = os.path.getsize(cache_path)
+        except FileNotFoundError:
+            replaced = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(content)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            if self.size < 0 or time.monotonic() - self._counted_at > RECOUNT_INTERVAL:
+                self.size = self._disk_usage()
+                self._counted_at = time.monotonic()
+            else:
+                self.size += len(content) - replaced
+            if self.size > self.max_bytes:
+                self._evict()
+
+        return cache_path
+
+    def _scan(self) -> list[os.DirEntry]:
+        """
+        :return: all cached files, leaving out the temporary files of writes in progress
+        """
+        entries: list[os.DirEntry] = []
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.is_file():
+                    continue
+                # stat() is cached by the entry, files removed later by other processes keep their last size
+                mtime: float = entry.stat().st_mtime
+                if not entry.name.endswith('.part'):
+                    entries.append(entry)
+                elif time.time() - mtime > PART_FILE_TTL:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def _disk_usage(self) -> int:
+        return sum(entry.stat().st_size for entry in self._scan())
+
+    def _evict(self):
+        entries = sorted(self._scan(), key=lambda entry: entry.stat().st_mtime)
+        self.size = sum(entry.stat().st_size for entry in entries)
+        self._counted_at = time.monotonic()
+        target: int = int(self.max_bytes * 0.9)
+        evicted: int = 0
+
+        for entry in entries:
+            if self.size <= target:
+                break
+            try:
+                size: int = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.size -= size
+            evicted += 1
+
+        logging.info(f'evicted {evicted} assets from {self.directory}, {self.size / 2**20:.1f} MiB left')
+
+
+asset_cache = AssetCache()
+
+
+@lru_cache(maxsize=DECODED_ICON_CACHE_SIZE)
+def load_icon(path: str, size: tuple[int, int]) -> Image.Image:
+    """
+    gets a decoded icon converted to RGBA and resized, from memory if it was loaded before.
+    The returned image is shared and must not be modified.
+
+    :param path: bungie.net path of the icon
+    :param size: width and height to resize the icon to
+    :return: the icon
+    """
+    return decode_icon(path, size)
+
+
+def decode_icon(path: str, size: tuple[int, int]) -> Image.Image:
+    """
+    :param path: bungie.net path of the icon, downloaded on a cache miss
+    :param size: width and height to resize the icon to
+    :return: the icon converted to RGBA and resized
+    """
+    with Image.open(asset_cache.get(path)) as image:
+        icon = image.convert(mode='RGBA', palette=Image.ADAPTIVE, colors=32)
+    return icon.resize(size)
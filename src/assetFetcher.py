@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+import aiohttp
+from assetCache import AssetCache, asset_cache, BUNGIE_ROOT
+from helperClasses import Weapon, PerkColumn
+from metrics import count_cache
+from perkAtlas import PerkAtlas, get_perk_atlas
+
+FETCH_CONCURRENCY: int = int(os.environ.get('RAHOOL_FETCH_CONCURRENCY', 16))
+FETCH_TIMEOUT: float = float(os.environ.get('RAHOOL_FETCH_TIMEOUT', 5))
+FETCH_RETRIES: int = int(os.environ.get('RAHOOL_FETCH_RETRIES', 2))
+RETRY_BACKOFF: float = 0.2
+
+
+class AssetFetcher:
+    """
+    Downloads bungie.net assets into the asset cache concurrently over one keep-alive session,
+    with a bounded number of requests in flight and per-request timeouts and retries.
+    """
+    cache: AssetCache
+    concurrency: int
+    timeout: float
+    retries: int
+
+    def __init__(self, cache: AssetCache = asset_cache, concurrency: int = FETCH_CONCURRENCY,
+                 timeout: float = FETCH_TIMEOUT, retries: int = FETCH_RETRIES):
+        """
+        :param cache: cache to download into
+        :param concurrency: maximum number of concurrent requests
+        :param timeout: seconds after which a single request is abandoned
+        :param retries: number of additional attempts after a failed request
+        """
+        self.cache = cache
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        :return: the shared session, created on first use inside the running event loop
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def fetch(self, path: str):
+        """
+        downloads an asset into the cache unless it is cached already
+
+        :param path: bungie.net path of the asset
+        :raises aiohttp.ClientError: if every attempt failed
+        :raises asyncio.TimeoutError: if every attempt timed out
+        """
+        cached: bool = self.cache.contains(path)
+        count_cache('asset', cached)
+        if cached:
+            return
+
+        session: aiohttp.ClientSession = self.get_session()
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    async with session.get(f'{BUNGIE_ROOT}{path}') as response:
+                        response.raise_for_status()
+                        content: bytes = await response.read()
+                await asyncio.to_thread(self.cache.put, path, content)
+                return
+            except aiohttp.ClientResponseError as e:
+                # not found or forbidden, retrying will not help
+                if e.status < 500 or attempt == self.retries:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    async def fetch_all(self, paths: list[str]) -> list[str]:
+        """
+        downloads all assets concurrently
+
+        :param paths: bungie.net paths of the assets
+        :return: paths of the assets that could not be downloaded
+        """
+        unique_paths: list[str] = list(dict.fromkeys(path for path in paths if path))
+        results = await asyncio.gather(*(self.fetch(path) for path in unique_paths), return_exceptions=True)
+
+        failed: list[str] = []
+        for path, result in zip(unique_paths, results):
+            if isinstance(result, BaseException):
+                logging.warning(f'asset {path} could not be fetched: {result!r}')
+                self.cache.mark_failed(path)
+                failed.append(path)
+        return failed
+
+    async def close(self):
+        """
+        closes the shared session
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+asset_fetcher = AssetFetcher()
+
+
+def get_render_assets(weapon: Weapon, perk_set: list[PerkColumn], damage_type_icon: str) -> list[str]:
+    """
+    :param weapon: weapon to render
+    :param perk_set: the weapon's perks
+    :param damage_type_icon: url of the weapon's damage type icon
+    :return: bungie.net paths of every asset the perk image of the weapon is composed of and the perk atlas
+        does not contain
+    """
+    atlas: Optional[PerkAtlas] = get_perk_atlas()
+    paths: list[str] = [weapon.get_screenshot(), damage_type_icon]
+    for column in perk_set:
+        for perk in column:
+            # icons in the perk atlas are rendered without their downloaded file
+            if atlas is None or atlas.get_icon(int(perk.get_hash()), perk.get_icon_url()) is None:
+                paths.append(perk.get_icon_url())
+    return paths
@@ -0,0 +1,435 @@
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+from helperClasses import Weapon, SocketSet, PlugSet, Perk, PerkColumn, DamageType, GodRollContainer
+from manifestIndex import normalize_name, ManifestDiff
+from readJSON import get_perk_plug_set_hashes
+from customExceptions import NoSuchWeaponError, NoRandomRollsError, NoGodRollError
+
+CATALOG_ENABLED: bool = os.environ.get('RAHOOL_CATALOG', '0') == '1'
+QUERY_CHUNK_SIZE = 500
+CATALOG_SNAPSHOT_PATH = 'resources/catalog_snapshot.bin'
+
+# magic, format version, manifest md5; followed by the pickled catalog tables
+SNAPSHOT_HEADER = struct.Struct('<4sH32s')
+SNAPSHOT_MAGIC = b'RCAT'
+# bump whenever the layout of the catalog tables changes
+SNAPSHOT_FORMAT_VERSION = 1
+
+# (socketTypeHash, randomizedPlugSetHash, reusablePlugSetHash); absent plug set hashes are None
+SocketRecord = tuple[int, Optional[int], Optional[int]]
+# (itemType, itemTypeAndTierDisplayName, name, collectibleHash, screenshot, defaultDamageTypeHash,
+#  socket entries, perk socket indices)
+WeaponRecord = tuple[int, str, str, str, str, int, tuple[SocketRecord, ...], tuple[int, ...]]
+# (name, icon, itemTypeDisplayName)
+PerkRecord = tuple[str, str, str]
+
+
+class Catalog:
+    """
+    Compact in-memory projection of the game database fields used by /perks.
+    Resolves weapons, perks, damage types and curated rolls without SQL or json parsing.
+    """
+    names: dict[str, Optional[int]]
+    weapons: dict[int, WeaponRecord]
+    plug_sets: dict[int, tuple[int, ...]]
+    perks: dict[int, PerkRecord]
+    damage_types: dict[int, str]
+    god_rolls: dict[int, tuple[list[list[int]], list[list[int]]]]
+    generation: int
+    curation_generation: int
+
+    def __init__(self, generation: int = 0, curation_generation: int = 0):
+        """
+        :param generation: manifest connection pool generation the catalog was built from
+        :param curation_generation: curation connection pool generation the curated rolls were read from
+        """
+        self.names = {}
+        self.weapons = {}
+        self.plug_sets = {}
+        self.perks = {}
+        self.damage_types = {}
+        self.god_rolls = {}
+        self.generation = generation
+        self.curation_generation = curation_generation
+
+    def find_weapon(self, item_name: str) -> Weapon:
+        """
+        :param item_name: the name of the weapon
+        :return: the first random rolled weapon with the given name
+        :raises NoSuchWeaponError: when no item has the given name
+        :raises NoRandomRollsError: when no item with the given name is a random rolled weapon
+        """
+        normalized_name: str = normalize_name(item_name)
+        if normalized_name not in self.names:
+            raise NoSuchWeaponError
+
+        weapon_hash: Optional[int] = self.names[normalized_name]
+        if weapon_hash is None:
+            raise NoRandomRollsError
+
+        return self.get_weapon(weapon_hash)
+
+    def get_weapon(self, weapon_hash: int) -> Weapon:
+        """
+        :param weapon_hash: hash of a random rolled weapon
+        :return: the Weapon
+        """
+        (item_type, item_type_and_tier, name, collectible_hash, screenshot, damage_type,
+         socket_records, perk_socket_indices) = self.weapons[weapon_hash]
+
+        sockets: list[dict[str, int]] = []
+        for socket_type, randomized_plug_set, reusable_plug_set in socket_records:
+            socket: dict[str, int] = {'socketTypeHash': socket_type}
+            if randomized_plug_set is not None:
+                socket['randomizedPlugSetHash'] = randomized_plug_set
+            if reusable_plug_set is not None:
+                socket['reusablePlugSetHash'] = reusable_plug_set
+            sockets.append(socket)
+
+        return Weapon.from_fields(item_type=item_type,
+                                  type=item_type_and_tier,
+                                  name=name,
+                                  collectible_hash=collectible_hash,
+                                  hash=str(weapon_hash),
+                                  screenshot_url=screenshot,
+                                  damage_type=damage_type,
+                                  socket_set=SocketSet.from_fields(sockets, list(perk_socket_indices)))
+
+    def get_perk_columns(self, socket_set: SocketSet) -> list[PerkColumn]:
+        """
+        :param socket_set: weapon's perk sockets
+        :return: weapon perks ordered by column and plug set as List of PerkColumn
+        """
+        columns: list[PerkColumn] = []
+        for plug_set_hash in get_perk_plug_set_hashes(socket_set):
+            column: PerkColumn = PerkColumn()
+            for perk_hash in self.plug_sets.get(plug_set_hash, ()):
+                if perk_hash not in self.perks:
+                    continue
+                name, icon, item_type = self.perks[perk_hash]
+                column.append_perk(Perk.from_fields(hash=str(perk_hash), name=name, icon_url=icon, item_type=item_type))
+            columns.append(column)
+
+        return columns
+
+    def get_damage_type_icon(self, dmg_hash: int) -> str:
+        """
+        :param dmg_hash: hash of the damage type
+        :return: damage type icon url, requires bungie.net base url
+        """
+        return self.damage_types[int(dmg_hash)]
+
+    def get_god_rolls(self, weapon_hash: str) -> GodRollContainer:
+        """
+        :param weapon_hash: weapon's hash value
+        :return: the weapon's pvp and pve recommendations
+        :raises NoGodRollError: when there are no recommendations for the weapon
+        """
+        if int(weapon_hash) not in self.god_rolls:
+            raise NoGodRollError
+
+        pvp_rolls, pve_rolls = self.god_rolls[int(weapon_hash)]
+        return GodRollContainer.from_fields(pvp_rolls=pvp_rolls, pve_rolls=pve_rolls, weapon_hash=str(weapon_hash))
+
+    def memory_report(self) -> dict[str, int]:
+        """
+        :return: approximate deep size in bytes of every catalog structure
+        """
+        seen: set[int] = set()
+        return {
+            'names': deep_size(self.names, seen),
+            'weapons': deep_size(self.weapons, seen),
+            'plug_sets': deep_size(self.plug_sets, seen),
+            'perks': deep_size(self.perks, seen),
+            'damage_types': deep_size(self.damage_types, seen),
+            'god_rolls': deep_size(self.god_rolls, seen),
+        }
+
+
+def deep_size(obj, seen: set[int]) -> int:
+    """
+    :param obj: container or value to measure
+    :param seen: ids of objects already counted, shared strings are only counted once
+    :return: size of the object and everything it references in bytes
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size: int = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+def fetch_by_ids(con: sqlite3.Connection, table: str, ids: list[int]) -> list[str]:
+    """
+    :param con: connection to the game database
+    :param table: table to query
+    :param ids: primary keys of the requested rows
+    :return: json column of all rows found
+    """
+    rows: list[str] = []
+    for i in range(0, len(ids), QUERY_CHUNK_SIZE):
+        chunk: list[int] = ids[i:i + QUERY_CHUNK_SIZE]
+        cur = con.execute(f"SELECT json FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+        rows.extend(row[0] for row in cur.fetchall())
+    return rows
+
+
+def build_catalog(con: sqlite3.Connection, curation_con: sqlite3.Connection, generation: int = 0,
+                  previous: Optional[Catalog] = None, diff: Optional[ManifestDiff] = None) -> Catalog:
+    """
+    projects all random rolled weapons and everything /perks needs to display them into a Catalog.
+    Given the catalog of the previous game database and the differences to it, only changed definitions are
+    projected again and all other entries are reused.
+
+    :param con: connection to the game database
+    :param curation_con: connection to the curated rolls database
+    :param generation: manifest connection pool generation of con
+    :param previous: catalog of the previously installed game database
+    :param diff: differences between the previous and the current game database
+    :return: the Catalog
+    :raises sqlite3.Error: when a database query fails
+    """
+    from readDB import hash_to_id
+    catalog: Catalog = Catalog(generation)
+    if previous is None or diff is None:
+        previous, changed_items, changed_plug_sets = Catalog(), set(), set()
+    else:
+        changed_items = diff.changed_hashes('DestinyInventoryItemDefinition')
+        changed_plug_sets = diff.changed_hashes('DestinyPlugSetDefinition')
+
+    weapon_ids: list[int] = []
+    for name, item_hash, item_id, item_type, random_roll in con.execute(
+            'SELECT name, hash, id, item_type, random_roll FROM WeaponNameIndex ORDER BY id'):
+        if catalog.names.get(name) is not None:
+            continue
+        catalog.names[sys.intern(name)] = item_hash if random_roll else None
+        if not random_roll:
+            continue
+        if item_hash in previous.weapons and item_hash not in changed_items:
+            catalog.weapons[item_hash] = previous.weapons[item_hash]
+        else:
+            weapon_ids.append(item_id)
+
+    for json_string in fetch_by_ids(con, 'DestinyInventoryItemDefinition', weapon_ids):
+        weapon: Weapon = Weapon(json_string)
+        socket_set: SocketSet = weapon.get_socket_set()
+        socket_records: tuple[SocketRecord, ...] = tuple(
+            (socket['socketTypeHash'], socket.get('randomizedPlugSetHash'), socket.get('reusablePlugSetHash'))
+            for socket in socket_set.sockets)
+        catalog.weapons[int(weapon.get_hash())] = (
+            weapon.get_item_type(), sys.intern(weapon.get_type()), weapon.get_name(), weapon.get_collectible_hash(),
+            weapon.get_screenshot(), weapon.get_damage_type(), socket_records,
+            tuple(socket_set.get_perk_socket_indices()))
+
+    plug_set_ids: list[int] = []
+    for weapon_hash in catalog.weapons:
+        for plug_set_hash in get_perk_plug_set_hashes(catalog.get_weapon(weapon_hash).get_socket_set()):
+            if plug_set_hash in catalog.plug_sets:
+                continue
+            if plug_set_hash in previous.plug_sets and plug_set_hash not in changed_plug_sets:
+                catalog.plug_sets[plug_set_hash] = previous.plug_sets[plug_set_hash]
+            else:
+                # placeholder until the plug set is projected, also deduplicates the query
+                catalog.plug_sets[plug_set_hash] = ()
+                plug_set_ids.append(hash_to_id(plug_set_hash))
+
+    for json_string in fetch_by_ids(con, 'DestinyPlugSetDefinition', plug_set_ids):
+        catalog.plug_sets[json.loads(json_string)['hash']] = tuple(PlugSet(json_string).get_perk_hashes())
+
+    perk_ids: list[int] = []
+    for perk_hashes in catalog.plug_sets.values():
+        for perk_hash in perk_hashes:
+            if perk_hash in catalog.perks:
+                continue
+            if perk_hash in previous.perks and perk_hash not in changed_items:
+                catalog.perks[perk_hash] = previous.perks[perk_hash]
+            else:
+                catalog.perks[perk_hash] = None
+                perk_ids.append(hash_to_id(perk_hash))
+
+    for json_string in fetch_by_ids(con, 'DestinyInventoryItemDefinition', perk_ids):
+        perk: Perk = Perk(json_string)
+        catalog.perks[int(perk.get_hash())] = (perk.get_name(), sys.intern(perk.get_icon_url()),
+                                               sys.intern(perk.item_type))
+    catalog.perks = {perk_hash: perk for perk_hash, perk in catalog.perks.items() if perk is not None}
+
+    for item_id, json_string in con.execute('SELECT id, json FROM DestinyDamageTypeDefinition'):
+        catalog.damage_types[item_id % 2**32] = DamageType(json_string).get_icon()
+
+    # the curated rolls may have changed since the previous catalog was built
+    catalog.god_rolls = load_god_rolls(curation_con)
+
+    logging.info(f'catalog projected {len(weapon_ids)} weapons, {len(plug_set_ids)} plug sets and '
+                 f'{len(perk_ids)} perks, reused {len(catalog.weapons) - len(weapon_ids)} weapons')
+    return catalog
+
+
+def load_god_rolls(curation_con: sqlite3.Connection) -> dict[int, tuple[list[list[int]], list[list[int]]]]:
+    """
+    :param curation_con: connection to the curated rolls database
+    :return: pvp and pve recommendations by weapon hash
+    :raises sqlite3.Error: when the database query fails
+    """
+    god_rolls: dict[int, tuple[list[list[int]], list[list[int]]]] = {}
+    for json_string, in curation_con.execute('SELECT json FROM Weapons'):
+        container: GodRollContainer = GodRollContainer(json_string)
+        god_rolls[int(container.weapon_hash)] = (container.pvp_rolls, container.pve_rolls)
+    return god_rolls
+
+
+def save_snapshot(catalog: Catalog, manifest_md5: str, path: str = CATALOG_SNAPSHOT_PATH):
+    """
+    writes everything the catalog derived from the game database to a snapshot, replacing the file atomically.
+    Curated rolls are left out, they change independently of the game database.
+
+    :param catalog: the catalog
+    :param manifest_md5: md5 sum of the game database the catalog was built from
+    :param path: file to write to
+    """
+    tables = (catalog.names, catalog.weapons, catalog.plug_sets, catalog.perks, catalog.damage_types)
+
+    directory: str = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, manifest_md5.encode()))
+            pickle.dump(tables, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_snapshot(manifest_md5: str, generation: int = 0, path: str = CATALOG_SNAPSHOT_PATH) -> Optional[Catalog]:
+    """
+    loads a catalog written by save_snapshot, without its curated rolls
+
+    :param manifest_md5: md5 sum of the installed game database
+    :param generation: manifest connection pool generation the catalog is used with
+    :param path: file to read
+    :return: the catalog, None if there is no snapshot of the given game database in the current format
+    """
+    try:
+        with open(path, 'rb') as file:
+            content: bytes = file.read()
+    except FileNotFoundError:
+        return None
+
+    if len(content) < SNAPSHOT_HEADER.size:
+        return None
+    magic, version, md5 = SNAPSHOT_HEADER.unpack_from(content)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION or md5.rstrip(b'\0').decode() != manifest_md5:
+        return None
+
+    catalog: Catalog = Catalog(generation)
+    try:
+        # the snapshot is written by this process or an earlier run of it, never downloaded
+        catalog.names, catalog.weapons, catalog.plug_sets, catalog.perks, catalog.damage_types = pickle.loads(
+            memoryview(content)[SNAPSHOT_HEADER.size:])
+    except (pickle.UnpicklingError, EOFError, ValueError, TypeError) as e:
+        logging.warning(f'catalog snapshot {path} unreadable: {e}')
+        return None
+    return catalog
+
+
+def save_snapshot_safely(catalog: Catalog, manifest_md5: Optional[str]):
+    """
+    saves a snapshot of the catalog, logging instead of raising on failure
+    """
+    if manifest_md5 is None:
+        return
+    try:
+        save_snapshot(catalog, manifest_md5)
+    except OSError as e:
+        logging.error(f'catalog snapshot could not be written: {e}')
+
+
+_catalog: Optional[Catalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """
+    returns the catalog of the currently installed game database, (re)building it when it is missing or stale
+
+    :return: the current Catalog
+    """
+    global _catalog
+    from readDB import manifest_pool, curation_pool, refresh_curation
+
+    curation_generation: int = refresh_curation()
+    catalog: Optional[Catalog] = _catalog
+    if (catalog is not None and catalog.generation == manifest_pool.generation
+            and catalog.curation_generation == curation_generation):
+        return catalog
+
+    with _catalog_lock:
+        if _catalog is not None and _catalog.generation == manifest_pool.generation:
+            if _catalog.curation_generation != curation_generation:
+                _catalog.god_rolls = load_god_rolls(curation_pool.get_connection())
+                _catalog.curation_generation = curation_generation
+                logging.info(f'catalog reloaded {len(_catalog.god_rolls)} curated rolls')
+            return _catalog
+
+        start: float = time.perf_counter()
+        generation: int = manifest_pool.generation
+        con: sqlite3.Connection = manifest_pool.get_connection()
+        version: Optional[str] = manifest_pool.version
+
+        snapshot: Optional[Catalog] = load_snapshot(version, generation) if version is not None else None
+        if snapshot is not None:
+            snapshot.god_rolls = load_god_rolls(curation_pool.get_connection())
+            snapshot.curation_generation = curation_generation
+            _catalog = snapshot
+            logging.info(f'catalog loaded from snapshot in {time.perf_counter() - start:.3f}s; '
+                         f'{len(_catalog.weapons)} weapons, {len(_catalog.perks)} perks')
+            return _catalog
+
+        _catalog = build_catalog(con, curation_pool.get_connection(), generation)
+        _catalog.curation_generation = curation_generation
+        report: dict[str, int] = _catalog.memory_report()
+        logging.info(f'catalog built in {time.perf_counter() - start:.2f}s; {len(_catalog.weapons)} weapons, '
+                     f'{len(_catalog.perks)} perks, {sum(report.values()) / 2**20:.1f} MiB {report}')
+        save_snapshot_safely(_catalog, version)
+        return _catalog
+
+
+def refresh_catalog(diff: Optional[ManifestDiff]):
+    """
+    incrementally rebuilds the catalog after a new game database was installed and snapshots it, if the catalog is
+    enabled
+
+    :param diff: differences to the previously installed game database, None forces a full rebuild
+    """
+    global _catalog
+    from readDB import manifest_pool, curation_pool, refresh_curation
+
+    if not CATALOG_ENABLED:
+        return
+    curation_generation: int = refresh_curation()
+    with _catalog_lock:
+        if _catalog is not None and _catalog.generation != manifest_pool.generation:
+            start: float = time.perf_counter()
+            _catalog = build_catalog(manifest_pool.get_connection(), curation_pool.get_connection(),
+                                     manifest_pool.generation, previous=_catalog, diff=diff)
+            _catalog.curation_generation = curation_generation
+            logging.info(f'catalog refreshed in {time.perf_counter() - start:.2f}s')
+            save_snapshot_safely(_catalog, manifest_pool.version)
+            return
+    # nothing to refresh incrementally, build it from scratch now instead of on the first /perks call
+    get_catalog()
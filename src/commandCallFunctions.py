@@ -1,32 +1,249 @@
+import asyncio
+import logging
+from typing import Optional
 from helperClasses import Weapon, PerkColumn, GodRollContainer
-from readDB import query_weapon, query_god_roll
-from readJSON import get_weapon_plug_hashes
+from readDB import query_weapon, query_weapon_by_hash, query_god_roll, query_damage_type, manifest_pool
+from readJSON import load_weapon_perks
 from createImages import create_perk_image
-from customExceptions import NoGodRollError
-import os
+from assetFetcher import asset_fetcher, get_render_assets
+from renderCache import RenderKey, render_cache, get_render_key
+from catalog import CATALOG_ENABLED, get_catalog
+from workerPools import run_blocking, run_render
+from weaponSearch import WeaponSearchIndex, get_search_index
+from popularity import popularity
+from metrics import Gauge, span, count_cache, coalesced_requests
+from customExceptions import NoSuchWeaponError, NoRandomRollsError, NoGodRollError
 
+# seconds a pre-render waits for live requests to finish before checking again
+PREWARM_IDLE_WAIT: float = 0.5
+# pre-rendering stops once the render cache is this full, so it never evicts renders of live requests
+PREWARM_CACHE_FILL: float = 0.9
 
-async def generate_perk_information_image(weapon_name: str) -> str:
+# /perks requests currently being answered
+live_requests: int = 0
+Gauge('rahool_requests_in_flight', '/perks requests currently being answered', lambda: live_requests)
+# renders in progress, awaited by every request for the same weapon that arrives meanwhile
+in_flight_renders: dict[RenderKey, asyncio.Task] = {}
+Gauge('rahool_renders_in_flight', 'renders currently in progress', lambda: len(in_flight_renders))
+
+
+def lookup_weapon(weapon_name: str) -> Weapon:
     """
-    generates and locally stores perk information image
+    gets a random rolled weapon by its exact name from the catalog if enabled or the game database
 
-    :param weapon_name: name of the weapon for which to generate the image
-    :return: name of the locally stored image
+    :param weapon_name: name of the weapon
+    :return: the weapon
+    """
+    if CATALOG_ENABLED:
+        return get_catalog().find_weapon(weapon_name)
+    return query_weapon(weapon_name)
+
+
+def find_weapon(weapon_name: str) -> Weapon:
+    """
+    gets a random rolled weapon by name, falling back to the closest name if the given one is misspelled
+
+    :param weapon_name: name of the weapon
+    :return: the weapon
+    :raises NoSuchWeaponError: with suggestions of similar names when there is no unambiguous match
     """
-    weapon: Weapon
-    god_rolls: GodRollContainer
+    with span('weapon_lookup'):
+        try:
+            return lookup_weapon(weapon_name)
+        except NoSuchWeaponError:
+            search_index: WeaponSearchIndex = get_search_index()
+            corrected_name: Optional[str] = search_index.correct(weapon_name)
+            if corrected_name is None:
+                raise NoSuchWeaponError([name for name, _ in search_index.find_similar(weapon_name)])
 
-    weapon = query_weapon(weapon_name)
-    weapon_perks: list[PerkColumn] = await get_weapon_plug_hashes(weapon.get_socket_set())
+        return lookup_weapon(corrected_name)
+
+
+def resolve_perks(weapon: Weapon) -> tuple[list[PerkColumn], str]:
+    """
+    gets a weapon's curated perks and its damage type icon from the catalog if enabled or the game database,
+    blocks on database queries
+
+    :param weapon: the weapon
+    :return: the weapon's perks ordered by column and its damage type icon url
+    """
+    if CATALOG_ENABLED:
+        catalog = get_catalog()
+        with span('perk_resolution'):
+            weapon_perks: list[PerkColumn] = catalog.get_perk_columns(weapon.get_socket_set())
+        try:
+            with span('curation'):
+                catalog.get_god_rolls(weapon.get_hash()).apply_to_perk_set(perk_set=weapon_perks)
+        except NoGodRollError:
+            pass
+        return weapon_perks, catalog.get_damage_type_icon(weapon.get_damage_type())
+
+    weapon_perks = load_weapon_perks(weapon.get_socket_set())
 
     try:
-        god_rolls = GodRollContainer(query_god_roll(weapon.get_hash()))
-        god_rolls.apply_to_perk_set(perk_set=weapon_perks)
+        with span('curation'):
+            god_rolls: GodRollContainer = GodRollContainer(query_god_roll(weapon.get_hash()))
+            god_rolls.apply_to_perk_set(perk_set=weapon_perks)
     except NoGodRollError:
         pass
 
-    create_perk_image(weapon, weapon_perks)
-    os.remove(f'{weapon.get_damage_type()}.png')
+    return weapon_perks, query_damage_type(weapon.get_damage_type())
+
+
+async def resolve_weapon(weapon_name: str) -> tuple[Weapon, list[PerkColumn], str]:
+    """
+    gets a weapon, its curated perks and its damage type icon
+
+    :param weapon_name: name of the weapon
+    :return: the weapon, its perks ordered by column and its damage type icon url
+    """
+    weapon: Weapon = await run_blocking(find_weapon, weapon_name)
+    weapon_perks, damage_type_icon = await run_blocking(resolve_perks, weapon)
+    return weapon, weapon_perks, damage_type_icon
+
+
+def find_render_target(weapon_name: str) -> tuple[Weapon, RenderKey]:
+    """
+    gets a random rolled weapon by name and the key of its render, blocks on database queries
+
+    :param weapon_name: name of the weapon
+    :return: the weapon and its render key
+    """
+    weapon: Weapon = find_weapon(weapon_name)
+    return weapon, get_render_key(weapon)
+
+
+def get_render_target(weapon_hash: int) -> tuple[Weapon, RenderKey]:
+    """
+    gets a random rolled weapon by hash and the key of its render, blocks on database queries
+
+    :param weapon_hash: the weapon's hash value
+    :return: the weapon and its render key
+    :raises NoSuchWeaponError: when the weapon does not exist (anymore)
+    :raises NoRandomRollsError: when the weapon is not random rolled (anymore)
+    """
+    if CATALOG_ENABLED:
+        catalog = get_catalog()
+        if weapon_hash not in catalog.weapons:
+            raise NoSuchWeaponError
+        weapon: Weapon = catalog.get_weapon(weapon_hash)
+    else:
+        weapon = query_weapon_by_hash(weapon_hash)
+        if not weapon.has_random_roll():
+            raise NoRandomRollsError
+
+    return weapon, get_render_key(weapon)
+
+
+async def render_weapon(weapon: Weapon, render_key: RenderKey, generation: int) -> bytes:
+    """
+    resolves, downloads and renders the perk information image of a weapon and caches it
+
+    :param weapon: the weapon
+    :param render_key: the weapon's render key
+    :param generation: manifest connection pool generation the weapon was read from
+    :return: the image encoded as PNG
+    """
+    weapon_perks, damage_type_icon = await run_blocking(resolve_perks, weapon)
+    with span('asset_fetch'):
+        unavailable: list[str] = await asset_fetcher.fetch_all(get_render_assets(weapon, weapon_perks,
+                                                                                 damage_type_icon))
+
+    # compositing, blurring and encoding hold the GIL, render in another process;
+    # its asset cache does not know which downloads just failed, so it is told instead of retrying them
+    with span('render'):
+        image: bytes = await run_render(create_perk_image, weapon, weapon_perks, damage_type_icon,
+                                        frozenset(unavailable))
+
+    # a manifest swap during the render may have mixed both versions
+    if manifest_pool.generation == generation:
+        render_cache.put(render_key, image)
+
+    return image
+
+
+def finish_render(render: asyncio.Task, render_key: RenderKey):
+    """
+    forgets a finished render and logs its failure, which is never retrieved if every caller was cancelled
+
+    :param render: the finished render
+    :param render_key: the rendered weapon's render key
+    """
+    in_flight_renders.pop(render_key, None)
+    if not render.cancelled() and render.exception() is not None:
+        logging.error(f'rendering weapon {render_key[0]} failed: {render.exception()!r}')
+
+
+async def render_once(weapon: Weapon, render_key: RenderKey, generation: int) -> bytes:
+    """
+    renders a weapon, or joins its render if one is in progress already
+
+    :param weapon: the weapon
+    :param render_key: the weapon's render key
+    :param generation: manifest connection pool generation the weapon was read from
+    :return: the image encoded as PNG
+    :raises Exception: whatever the shared render raised, to every caller awaiting it
+    """
+    render: Optional[asyncio.Task] = in_flight_renders.get(render_key)
+    if render is None:
+        render = asyncio.create_task(render_weapon(weapon, render_key, generation))
+        in_flight_renders[render_key] = render
+        render.add_done_callback(lambda task: finish_render(task, render_key))
+    else:
+        coalesced_requests.inc()
+
+    # a cancelled caller must not cancel the render the others are waiting for
+    return await asyncio.shield(render)
+
+
+async def generate_perk_information_image(weapon_name: str) -> tuple[bytes, str]:
+    """
+    generates the perk information image in memory, reusing a cached render if the weapon, manifest and
+    curation data did not change since
+
+    :param weapon_name: name of the weapon for which to generate the image
+    :return: the image encoded as PNG and a file name to upload it under
+    """
+    global live_requests
+    live_requests += 1
+    try:
+        generation: int = manifest_pool.generation
+        weapon, render_key = await run_blocking(find_render_target, weapon_name)
+        popularity.record(weapon.get_hash())
+        file_name: str = f'{weapon.get_collectible_hash()}.png'
+
+        image: Optional[bytes] = render_cache.get(render_key)
+        count_cache('render', image is not None)
+        if image is None:
+            image = await render_once(weapon, render_key, generation)
+        return image, file_name
+    finally:
+        live_requests -= 1
+
+
+async def prewarm_renders(weapon_hashes: list[int]):
+    """
+    renders weapons into the render cache one at a time, only while no /perks request is being answered
+
+    :param weapon_hashes: hashes of the weapons to render, most important first
+    """
+    rendered: int = 0
+    for weapon_hash in weapon_hashes:
+        if render_cache.size >= render_cache.max_bytes * PREWARM_CACHE_FILL:
+            break
+        while live_requests > 0:
+            await asyncio.sleep(PREWARM_IDLE_WAIT)
 
-    return f'{weapon.get_collectible_hash()}.png'
+        try:
+            generation: int = manifest_pool.generation
+            weapon, render_key = await run_blocking(get_render_target, weapon_hash)
+            if render_cache.contains(render_key):
+                continue
+            await render_once(weapon, render_key, generation)
+            rendered += 1
+        except (NoSuchWeaponError, NoRandomRollsError):
+            continue
+        except Exception as e:
+            logging.warning(f'pre-rendering weapon {weapon_hash} failed: {e!r}')
 
+    logging.info(f'pre-rendered {rendered} of {len(weapon_hashes)} popular weapons')
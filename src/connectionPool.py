@@ -0,0 +1,82 @@
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+MMAP_SIZE: int = int(os.environ.get('RAHOOL_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+CACHE_SIZE_KIB: int = int(os.environ.get('RAHOOL_SQLITE_CACHE_KIB', 32 * 1024))
+
+
+class ConnectionPool:
+    """
+    Hands out one long-lived read-only connection per worker thread for a single database file.
+    Swapping the pool makes every thread reopen its connection on its next query, so readers move over
+    to a replaced database file atomically while in-flight queries finish on the old one.
+    """
+    path: str
+    generation: int
+    version: Optional[str]
+    prepare: Optional[Callable[[], None]]
+
+    def __init__(self, path: str, prepare: Optional[Callable[[], None]] = None):
+        """
+        :param path: path of the database file
+        :param prepare: called once per generation before the first connection is opened,
+        e.g. to download or index the database
+        """
+        self.path = path
+        self.generation = 0
+        self.version = None
+        self.prepare = prepare
+        self._prepared_generation = -1
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        :return: the calling thread's connection for the current generation
+        :raises sqlite3.Error: when the database can not be opened
+        """
+        generation: int = self.generation
+        con: Optional[sqlite3.Connection] = getattr(self._local, 'connection', None)
+        if con is not None:
+            if self._local.generation == generation:
+                return con
+            con.close()
+            self._local.connection = None
+
+        self._prepare(generation)
+        con = self._open()
+        self._local.connection = con
+        self._local.generation = generation
+        return con
+
+    def swap(self, version: Optional[str] = None):
+        """
+        retires all open connections; each thread reopens the database file on its next query
+
+        :param version: label of the database file now in place, e.g. its md5 sum
+        """
+        with self._lock:
+            self.version = version
+            self.generation += 1
+        logging.info(f'connection pool for {self.path} swapped to generation {self.generation}')
+
+    def _prepare(self, generation: int):
+        if self.prepare is None or self._prepared_generation == generation:
+            return
+        with self._lock:
+            if self._prepared_generation != generation:
+                self.prepare()
+                self._prepared_generation = generation
+
+    def _open(self) -> sqlite3.Connection:
+        uri: str = f'{Path(self.path).resolve().as_uri()}?mode=ro&immutable=1'
+        con = sqlite3.connect(uri, uri=True)
+        con.execute('PRAGMA query_only = ON')
+        con.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        con.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+        logging.debug(f'opened read-only connection to {self.path} on {threading.current_thread().name}')
+        return con
@@ -1,12 +1,24 @@
+import glob
+import io
+import logging
 import os
-
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageFilter
+from functools import lru_cache
+from typing import Collection, Optional
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
 from enum import Enum
 from helperClasses import Weapon, PerkColumn
-from readDB import query_damage_type
-import urllib.request
+from assetCache import asset_cache, load_icon
+from perkAtlas import PerkAtlas, PERK_ICON_SIZE, get_perk_atlas
 
+# bump whenever the layout changes, invalidates all cached renders
+RENDER_TEMPLATE_VERSION: int = 3
 COL_WIDTH: int = 500
+IMAGE_SIZE: tuple[int, int] = (1920, 1080)
+FONT_DIR: str = 'resources/fonts'
+GLOW_DIR: str = 'resources/image_assets'
+# opacity of the black layer darkening the screenshot
+DARKEN_ALPHA: int = 96
+BACKGROUND_QUALITY: int = 90
 ENHANCED_PERK_DISCLAIMER: str = '(this weapon has enhanced perks obtainable through the relic on Mars)'
 curation_color = {
     0: (200, 200, 200),
@@ -16,69 +28,166 @@ curation_color = {
 }
 
 
-def create_perk_image(weapon: Weapon, perk_set: list[PerkColumn]) -> str:
+def create_perk_image(weapon: Weapon, perk_set: list[PerkColumn], damage_type_icon: str,
+                      unavailable: Collection[str] = ()) -> bytes:
     """
     creates image with weapon information
 
     :param weapon: the weapon for which to create the image
     :param perk_set: the weapon's perk_set
+    :param damage_type_icon: url of the weapon's damage type icon, requires bungie.net base url
+    :param unavailable: bungie.net paths of assets that just failed to download, left out instead of retried
+    :return: the image encoded as PNG
+    :raises FileNotFoundError: if the weapon's screenshot is unavailable and its background is not cached
+    """
+    return encode_image(compose_perk_image(weapon, perk_set, damage_type_icon, unavailable))
+
+
+def compose_perk_image(weapon: Weapon, perk_set: list[PerkColumn], damage_type_icon: str,
+                       unavailable: Collection[str] = ()) -> Image.Image:
+    """
+    composites the screenshot, perks and decorations of a weapon
+
+    :param weapon: the weapon for which to create the image
+    :param perk_set: the weapon's perk_set
+    :param damage_type_icon: url of the weapon's damage type icon, requires bungie.net base url
+    :param unavailable: bungie.net paths of assets that just failed to download, left out instead of retried
+    :return: the composited image
+    :raises FileNotFoundError: if the weapon's screenshot is unavailable and its background is not cached
     """
     # open/create required images
-    urllib.request.urlretrieve(f'https://bungie.net{weapon.get_screenshot()}',
-                               f'{weapon.get_collectible_hash()}.png')
-    urllib.request.urlretrieve(f'https://bungie.net{query_damage_type(weapon.get_damage_type())}',
-                               f'{weapon.get_damage_type()}.png')
+    weapon_img = load_background(weapon, unavailable)
+
+    # add text on the background
+    weapon_edit = ImageDraw.Draw(weapon_img)
+    weapon_edit.text((130, 15),
+                     weapon.get_name(),
+                     (255, 255, 255),
+                     load_font('FUTURA.ttf', 100))
+
+    draw_perks(weapon_img, weapon, perk_set, load_font('futur.ttf', 40), unavailable)
+    if damage_type_icon in unavailable:
+        logging.warning(f'damage type icon {damage_type_icon} unavailable')
+    else:
+        dmg_type_img = load_icon(damage_type_icon, (100, 100))
+        weapon_img.paste(dmg_type_img, (15, 15), dmg_type_img)
+
+    return weapon_img
+
+
+def get_background_key(weapon: Weapon) -> str:
+    """
+    :param weapon: the weapon
+    :return: asset cache path of the weapon's background, changes with everything the background is made of
+    """
+    return f'/rahool/backgrounds/{RENDER_TEMPLATE_VERSION}/{weapon.get_rarity()}{weapon.get_screenshot()}'
+
+
+def build_background(weapon: Weapon, unavailable: Collection[str] = ()) -> Image.Image:
+    """
+    :param weapon: the weapon
+    :param unavailable: bungie.net paths of assets that just failed to download
+    :return: the weapon's screenshot blurred, with the template of its rarity composited on top
+    :raises FileNotFoundError: if the screenshot is unavailable
+    """
+    if weapon.get_screenshot() in unavailable:
+        raise FileNotFoundError(f'screenshot {weapon.get_screenshot()} unavailable')
+    with Image.open(asset_cache.get(weapon.get_screenshot())) as screenshot:
+        background = screenshot.convert('RGB').filter(ImageFilter.BoxBlur(5))
+    template = get_template(weapon.get_rarity())
+    background.paste(template, (0, 0), template)
+    return background
+
+
+def load_background(weapon: Weapon, unavailable: Collection[str] = ()) -> Image.Image:
+    """
+    gets the weapon's background from the asset cache, building and caching it on first use
+
+    :param weapon: the weapon
+    :param unavailable: bungie.net paths of assets that just failed to download
+    :return: the background, a new image that may be drawn on
+    :raises FileNotFoundError: if the background is not cached and the screenshot is unavailable
+    """
+    key: str = get_background_key(weapon)
+    cache_path: Optional[str] = asset_cache.lookup(key)
+    if cache_path is not None:
+        try:
+            with Image.open(cache_path) as image:
+                return image.convert('RGB')
+        except OSError as e:
+            logging.warning(f'cached background {cache_path} unreadable, rebuilding it: {e}')
 
-    weapon_img = Image.open(f'{weapon.get_collectible_hash()}.png')
-    dmg_type_img = Image.open(f'{weapon.get_damage_type()}.png')
-    dmg_type_img = dmg_type_img.convert(mode='RGBA', palette=Image.ADAPTIVE, colors=32)
-    dmg_type_img = dmg_type_img.resize((100, 100))
-    overlay = Image.new('RGBA', (1920, 1080), (0, 0, 0, 96))
-    glow = Image.open(f'resources/image_assets/weapon_glow_{weapon.get_rarity()}.png')
+    buffer = io.BytesIO()
+    build_background(weapon, unavailable).save(buffer, format='JPEG', quality=BACKGROUND_QUALITY, subsampling=0)
+    asset_cache.put(key, buffer.getvalue())
+    # decode the stored version, so renders do not depend on whether the background was cached
+    return Image.open(buffer).convert('RGB')
 
-    # open required fonts
-    title = ImageFont.truetype('resources/fonts/FUTURA.ttf', 100)
-    base_text = ImageFont.truetype('resources/fonts/futur.ttf', 40)
 
-    weapon_img = weapon_img.filter(ImageFilter.BoxBlur(5))
+@lru_cache(maxsize=None)
+def load_font(file_name: str, size: int) -> ImageFont.FreeTypeFont:
+    """
+    :param file_name: font file in the font directory
+    :param size: font size
+    :return: the font, loaded once per process
+    """
+    return ImageFont.truetype(os.path.join(FONT_DIR, file_name), size)
+
 
-    # add text on overlay-layer
+@lru_cache(maxsize=None)
+def get_template(rarity: str) -> Image.Image:
+    """
+    builds the overlay layer every weapon of a rarity shares: the darkening, the rarity glow and the origin perk
+    divider. The returned image is shared and must be copied before drawing on it.
+
+    :param rarity: weapon rarity, e.g. Legendary
+    :return: the template overlay
+    """
+    overlay = Image.new('RGBA', IMAGE_SIZE, (0, 0, 0, DARKEN_ALPHA))
+    with Image.open(os.path.join(GLOW_DIR, f'weapon_glow_{rarity}.png')) as glow:
+        overlay.paste(glow, (0, 540), glow)
+
+    # add origin perk ui elements
     overlay_edit = ImageDraw.Draw(overlay)
-    overlay_edit.text((130, 15),
-                      weapon.get_name(),
-                      (255, 255, 255),
-                      title)
+    overlay_edit.line((0, 850, 1920, 850), width=10, fill=255)
+    overlay_edit.text((15, 870), spacing=20, text="Origin Perks", font=load_font('futur.ttf', 40),
+                      fill=(255, 255, 255))
+    return overlay
 
-    draw_perks(overlay, weapon, perk_set, base_text)
 
-    # composite all layers
-    enhance = ImageEnhance.Brightness(dmg_type_img)
-    mask = enhance.enhance(1)
-    overlay.paste(dmg_type_img, (15, 15), mask)
-    enhance = ImageEnhance.Brightness(glow)
-    mask = enhance.enhance(0.3)
-    overlay.paste(glow, (0, 540), mask)
-    enhance = ImageEnhance.Brightness(overlay)
-    mask = enhance.enhance(0.3)
-    weapon_img.paste(overlay, (0, 0), mask)
+def preload_templates():
+    """
+    loads the fonts and builds the templates of all rarities ahead of the first render
+    """
+    load_font('FUTURA.ttf', 100)
+    for glow_path in glob.glob(os.path.join(GLOW_DIR, 'weapon_glow_*.png')):
+        get_template(os.path.basename(glow_path)[len('weapon_glow_'):-len('.png')])
 
-    weapon_img.save(f"{weapon.get_collectible_hash()}.png")
-    os.remove(f'{weapon.get_collectible_hash()}_icon.png')
 
-    return weapon.get_collectible_hash()
+def encode_image(image: Image.Image) -> bytes:
+    """
+    :param image: image to encode
+    :return: the image encoded as PNG
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
 
+    return buffer.getvalue()
 
-def draw_perks(overlay: Image, weapon: Weapon, perk_set: list[PerkColumn], base_text: ImageFont):
+
+def draw_perks(image: Image, weapon: Weapon, perk_set: list[PerkColumn], base_text: ImageFont,
+               unavailable: Collection[str] = ()):
     """
     adds perks to the image
 
-    :param overlay: layer to draw on
+    :param image: background to draw on
     :param weapon: weapon for which to draw perks
     :param perk_set: perks to draw
     :param base_text: font for perk names
+    :param unavailable: bungie.net paths of icons that just failed to download, drawn without their icon
     """
-    overlay_edit = ImageDraw.Draw(overlay)
-    disclaimer = ""
+    image_edit = ImageDraw.Draw(image)
+    atlas: Optional[PerkAtlas] = get_perk_atlas()
 
     n_cols: int = 0
     perk_block_x: int = 20
@@ -86,9 +195,6 @@ def draw_perks(overlay: Image, weapon: Weapon, perk_set: list[PerkColumn], base_
     col_count = 0
 
     for column in perk_set:
-        if column.has_enhanced_perk():
-            disclaimer = ENHANCED_PERK_DISCLAIMER
-
         if col_count > 3:
             perk_block_y = 870
             perk_block_x = 250
@@ -102,35 +208,49 @@ def draw_perks(overlay: Image, weapon: Weapon, perk_set: list[PerkColumn], base_
             icon_urls.append(perk.get_icon_url())
             perk_text_width = base_text.getbbox(text=perk.get_name())[2]
 
-            overlay_edit.text((50 + perk_block_x, perk_block_y + depth * 52),
-                              text=perk.get_name(),
-                              font=base_text,
-                              fill=curation_color[perk.curation])
+            image_edit.text((50 + perk_block_x, perk_block_y + depth * 52),
+                            text=perk.get_name(),
+                            font=base_text,
+                            fill=curation_color[perk.curation])
 
             if perk_text_width > column_width:
                 column_width = perk_text_width
             depth += 1
 
-        overlay_edit.line((perk_block_x, perk_block_y, perk_block_x, perk_block_y + depth * 50),
-                          width=5,
-                          fill=255)
+        # the column line shows the screenshot without the darkening
+        undarken(image, (perk_block_x - 2, perk_block_y, perk_block_x + 3, perk_block_y + depth * 50 + 1))
 
         for i in range(depth):
-            urllib.request.urlretrieve(f'https://bungie.net{icon_urls[i]}',
-                                       f'{weapon.get_collectible_hash()}_icon.png')
-            icon = Image.open(f'{weapon.get_collectible_hash()}_icon.png')
-            icon = icon.convert(mode='RGBA', palette=Image.ADAPTIVE, colors=32)
-            icon = icon.resize((40, 40))
-            enhance = ImageEnhance.Brightness(icon)
-            mask = enhance.enhance(1)
-            overlay.paste(icon, (5 + perk_block_x, perk_block_y + i * 52), mask)
+            icon: Optional[Image.Image] = None
+            if atlas is not None:
+                icon = atlas.get_icon(int(column[i].get_hash()), icon_urls[i])
+            if icon is None and icon_urls[i] in unavailable:
+                logging.warning(f'perk icon {icon_urls[i]} unavailable')
+                continue
+            if icon is None:
+                try:
+                    icon = load_icon(icon_urls[i], PERK_ICON_SIZE)
+                except OSError as e:
+                    # render the remaining perks instead of failing on a single unavailable icon
+                    logging.warning(f'perk icon {icon_urls[i]} unavailable: {e}')
+                    continue
+            image.paste(icon, (5 + perk_block_x, perk_block_y + i * 52), icon)
 
         perk_block_x += 70 + column_width
         n_cols += 1
 
-        # add origin perk ui elements
-        overlay_edit.line((0, 850, 1920, 850), width=10, fill=255)
-        overlay_edit.text((15, 870), spacing=20, text="Origin Perks", font=base_text, fill=(255, 255, 255))
+    # add disclaimer
+    if any(column.has_enhanced_perk() for column in perk_set):
+        image_edit.text((15, 800), spacing=20, text=ENHANCED_PERK_DISCLAIMER, font=base_text,
+                        fill=(255, 230, 128))
+
 
-        # add disclaimer
-        overlay_edit.text((15, 800), spacing=20, text=disclaimer, font=base_text, fill=(255, 230, 128), alpha=0.8)
+def undarken(image: Image, box: tuple[int, int, int, int]):
+    """
+    reverts the darkening of the template inside a box of the background
+
+    :param image: background to draw on
+    :param box: left, upper, right and lower bound of the area
+    """
+    region = image.crop(box)
+    image.paste(region.point(lambda value: min(255, round(value * 255 / (255 - DARKEN_ALPHA)))), box)
@@ -1,5 +1,15 @@
+from typing import Optional
+
+
 class NoSuchWeaponError(Exception):
-    pass
+    suggestions: list[str]
+
+    def __init__(self, suggestions: Optional[list[str]] = None):
+        """
+        :param suggestions: names of existing weapons similar to the requested one
+        """
+        super().__init__()
+        self.suggestions = suggestions or []
 
 
 class NoRandomRollsError(Exception):
@@ -8,3 +18,7 @@ class NoRandomRollsError(Exception):
 
 class NoGodRollError(Exception):
     pass
+
+
+class InvalidManifestError(Exception):
+    pass
@@ -66,6 +66,25 @@ class Weapon(ManifestData):
         self.damage_type = weapon['defaultDamageTypeHash']
         self.socket_set = SocketSet(weapon['sockets'])
 
+    @classmethod
+    def from_fields(cls, item_type: int, type: str, name: str, collectible_hash: str, hash: str,
+                    screenshot_url: str, damage_type: str, socket_set: SocketSet) -> Weapon:
+        """
+        builds a weapon from already extracted values without parsing its database entry
+
+        :return: the Weapon
+        """
+        weapon = cls.__new__(cls)
+        weapon.item_type = item_type
+        weapon.type = type
+        weapon.name = name
+        weapon.collectible_hash = collectible_hash
+        weapon.hash = hash
+        weapon.screenshot_url = screenshot_url
+        weapon.damage_type = damage_type
+        weapon.socket_set = socket_set
+        return weapon
+
     def get_item_type(self) -> int:
         """
         :return: type of item encoded as Integer value
@@ -154,6 +173,18 @@ class SocketSet:
         self.sockets = socket_set['socketEntries']
         self.perk_socket_indices = socket_set['socketCategories'][1]['socketIndexes']
 
+    @classmethod
+    def from_fields(cls, sockets: list[dict[str, int]], perk_socket_indices: list[int]) -> SocketSet:
+        """
+        :param sockets: socket entries reduced to their plug set and socket type hashes
+        :param perk_socket_indices: indices of all sockets containing a static or a random perk set
+        :return: the SocketSet
+        """
+        socket_set = cls.__new__(cls)
+        socket_set.sockets = sockets
+        socket_set.perk_socket_indices = perk_socket_indices
+        return socket_set
+
     def get_size(self) -> int:
         """
         :return: size of socket list
@@ -270,7 +301,12 @@ class PerkColumn:
         """
         :param json_string: json-formatted perk query output of Destiny 2 database
         """
-        perk = Perk(json_string)
+        self.append_perk(Perk(json_string))
+
+    def append_perk(self, perk: Perk):
+        """
+        :param perk: perk to sort into the normal or enhanced perks
+        """
         if perk.is_enhanced():
             self.enhanced_perks.append(perk)
             return
@@ -305,6 +341,21 @@ class Perk(ManifestData):
         self.icon_url = perk['displayProperties']['icon']
         self.item_type = perk['itemTypeDisplayName']
 
+    @classmethod
+    def from_fields(cls, hash: str, name: str, icon_url: str, item_type: str) -> Perk:
+        """
+        builds an uncurated perk from already extracted values without parsing its database entry
+
+        :return: the Perk
+        """
+        perk = cls.__new__(cls)
+        perk.curation = GameModeFlag.empty
+        perk.hash = hash
+        perk.name = name
+        perk.icon_url = icon_url
+        perk.item_type = item_type
+        return perk
+
     def set_curation(self, gamemode: GameModeFlag):
         """
         Updates curation to either pvp, pve or both.
@@ -372,6 +423,20 @@ class GodRollContainer(ManifestData):
         self.pve_rolls = god_rolls['PVE']
         self.weapon_hash = str(god_rolls['hash'])
 
+    @classmethod
+    def from_fields(cls, pvp_rolls: list[list[int]], pve_rolls: list[list[int]],
+                    weapon_hash: str) -> GodRollContainer:
+        """
+        builds a recommendation container from already extracted values without parsing its database entry
+
+        :return: the GodRollContainer
+        """
+        god_rolls = cls.__new__(cls)
+        god_rolls.pvp_rolls = pvp_rolls
+        god_rolls.pve_rolls = pve_rolls
+        god_rolls.weapon_hash = weapon_hash
+        return god_rolls
+
     def apply_to_perk_set(self, perk_set: list[PerkColumn]):
         """
         Takes a weapon's Perks and updates their curation status according to the information
@@ -0,0 +1,232 @@
+import sqlite3
+import logging
+from pathlib import Path
+from helperClasses import Weapon
+from readJSON import ITEM_TYPE_WEAPON
+
+WEAPON_INDEX_TABLE = 'WeaponNameIndex'
+DIFF_TABLES = ['DestinyInventoryItemDefinition', 'DestinyPlugSetDefinition', 'DestinyDamageTypeDefinition']
+
+
+def normalize_name(name: str) -> str:
+    """
+    normalizes an item name for index lookups by collapsing whitespace and ignoring case
+
+    :param name: item name as typed by the user or stored in the game database
+    :return: normalized name
+    """
+    return ' '.join(name.split()).casefold()
+
+
+def has_weapon_index(con: sqlite3.Connection) -> bool:
+    """
+    :param con: connection to the game database
+    :return: True if the derived weapon name index exists, False if it doesn't
+    """
+    cur = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (WEAPON_INDEX_TABLE,))
+    return cur.fetchone() is not None
+
+
+def select_index_rows(con: sqlite3.Connection, condition: str = '1') -> list[tuple[str, str, int, int, int, int]]:
+    """
+    derives weapon name index rows from the named items of the game database
+
+    :param con: connection to the game database
+    :param condition: additional SQL condition on DestinyInventoryItemDefinition rows
+    :return: index rows ordered by item id
+    """
+    rows = con.execute(f"""
+        SELECT
+            id,
+            json_extract(json, '$.hash'),
+            json_extract(json, '$.displayProperties.name'),
+            json_extract(json, '$.itemType'),
+            json
+        FROM
+            DestinyInventoryItemDefinition
+        WHERE
+            json_extract(json, '$.displayProperties.name') <> '' AND {condition}
+        ORDER BY
+            id""")
+
+    index_rows: list[tuple[str, str, int, int, int, int]] = []
+    for item_id, item_hash, name, item_type, json_string in rows:
+        index_rows.append((normalize_name(name), name, item_hash, item_id, item_type,
+                           int(is_random_rolled_weapon(item_type, json_string))))
+    return index_rows
+
+
+def create_index_table(con: sqlite3.Connection):
+    """
+    :param con: connection to the game database, replaces any existing weapon name index
+    """
+    con.execute(f'DROP TABLE IF EXISTS main.{WEAPON_INDEX_TABLE}')
+    con.execute(f"""
+        CREATE TABLE main.{WEAPON_INDEX_TABLE} (
+            name TEXT NOT NULL,
+            display_name TEXT NOT NULL,
+            hash INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            item_type INTEGER,
+            random_roll INTEGER NOT NULL)""")
+    con.execute(f'CREATE INDEX main.{WEAPON_INDEX_TABLE}_name ON {WEAPON_INDEX_TABLE} (name)')
+
+
+def build_weapon_index(db_path: str):
+    """
+    (re)builds the derived name index of all named items inside the game database
+
+    :param db_path: path of the game database
+    :raises sqlite3.Error: when reading the items or writing the index fails
+    """
+    con = sqlite3.connect(db_path)
+    try:
+        index_rows: list[tuple[str, str, int, int, int, int]] = select_index_rows(con)
+        with con:
+            create_index_table(con)
+            con.executemany(f'INSERT INTO main.{WEAPON_INDEX_TABLE} VALUES (?, ?, ?, ?, ?, ?)', index_rows)
+    finally:
+        con.close()
+
+    logging.info(f'weapon index built with {len(index_rows)} entries')
+
+
+class ManifestDiff:
+    """
+    Rows that differ between an installed and a newly downloaded game database, compared by id and content.
+    """
+    changed: dict[str, set[int]]
+    removed: dict[str, set[int]]
+    changed_weapons: dict[int, str]
+
+    def __init__(self):
+        self.changed = {table: set() for table in DIFF_TABLES}
+        self.removed = {table: set() for table in DIFF_TABLES}
+        self.changed_weapons = {}
+
+    def changed_hashes(self, table: str) -> set[int]:
+        """
+        :param table: one of the compared tables
+        :return: hashes of all added, modified or removed rows of the table
+        """
+        return {item_id % 2**32 for item_id in self.changed[table] | self.removed[table]}
+
+
+def update_weapon_index(db_path: str, old_path: str) -> ManifestDiff:
+    """
+    builds the weapon name index of a new game database by reusing the index entries of all unchanged items
+    of the installed one, and determines which random rolled weapons changed
+
+    :param db_path: path of the new game database
+    :param old_path: path of the installed game database, must contain a weapon name index
+    :return: the differences between both databases
+    :raises sqlite3.Error: when comparing the databases or writing the index fails
+    """
+    diff: ManifestDiff = ManifestDiff()
+    con = sqlite3.connect(Path(db_path).resolve().as_uri(), uri=True)
+    try:
+        con.execute('ATTACH DATABASE ? AS old', (f'{Path(old_path).resolve().as_uri()}?mode=ro',))
+
+        for table in DIFF_TABLES:
+            diff.changed[table] = {row[0] for row in con.execute(f"""
+                SELECT new.id FROM main.{table} new LEFT JOIN old.{table} prev ON prev.id = new.id
+                WHERE prev.id IS NULL OR prev.json <> new.json""")}
+            diff.removed[table] = {row[0] for row in con.execute(f"""
+                SELECT prev.id FROM old.{table} prev LEFT JOIN main.{table} new ON new.id = prev.id
+                WHERE new.id IS NULL""")}
+
+        con.execute('CREATE TEMP TABLE changed_items (id INTEGER PRIMARY KEY)')
+        con.executemany('INSERT INTO temp.changed_items VALUES (?)',
+                        ((item_id,) for item_id in diff.changed['DestinyInventoryItemDefinition']))
+        index_rows: list[tuple[str, str, int, int, int, int]] = select_index_rows(
+            con, 'id IN (SELECT id FROM temp.changed_items)')
+
+        with con:
+            create_index_table(con)
+            con.execute(f"""
+                INSERT INTO main.{WEAPON_INDEX_TABLE}
+                SELECT prev.* FROM old.{WEAPON_INDEX_TABLE} prev JOIN main.DestinyInventoryItemDefinition item
+                ON item.id = prev.id
+                WHERE prev.id NOT IN (SELECT id FROM temp.changed_items)""")
+            con.executemany(f'INSERT INTO main.{WEAPON_INDEX_TABLE} VALUES (?, ?, ?, ?, ?, ?)', index_rows)
+
+        diff.changed_weapons = find_changed_weapons(con, diff)
+    finally:
+        con.close()
+
+    logging.info(f'weapon index updated with {len(index_rows)} changed entries; '
+                 f'{len(diff.changed_weapons)} weapons changed')
+    return diff
+
+
+def find_changed_weapons(con: sqlite3.Connection, diff: ManifestDiff) -> dict[int, str]:
+    """
+    :param con: connection to the new game database with the installed one attached as 'old'
+    :param diff: differences between both databases
+    :return: hash and name of every random rolled weapon that was added, removed or whose definition,
+    plug sets, perks or damage type changed
+    """
+    con.execute('CREATE TEMP TABLE changed_hashes (hash INTEGER PRIMARY KEY)')
+    changed_hashes: set[int] = diff.changed_hashes('DestinyInventoryItemDefinition')
+    con.executemany('INSERT INTO temp.changed_hashes VALUES (?)', ((h,) for h in changed_hashes))
+
+    # plug sets that changed themselves or offer a changed perk
+    plug_set_hashes: set[int] = diff.changed_hashes('DestinyPlugSetDefinition')
+    plug_set_hashes.update(row[0] for row in con.execute("""
+        SELECT DISTINCT json_extract(plug_set.json, '$.hash')
+        FROM main.DestinyPlugSetDefinition plug_set, json_each(plug_set.json, '$.reusablePlugItems') plug
+        WHERE json_extract(plug.value, '$.plugItemHash') IN (SELECT hash FROM temp.changed_hashes)"""))
+    con.executemany('INSERT OR IGNORE INTO temp.changed_hashes VALUES (?)', ((h,) for h in plug_set_hashes))
+    con.executemany('INSERT OR IGNORE INTO temp.changed_hashes VALUES (?)',
+                    ((h,) for h in diff.changed_hashes('DestinyDamageTypeDefinition')))
+
+    changed_weapons: dict[int, str] = dict(con.execute(f"""
+        SELECT DISTINCT weapon.hash, weapon.display_name
+        FROM main.{WEAPON_INDEX_TABLE} weapon JOIN main.DestinyInventoryItemDefinition item ON item.id = weapon.id,
+            json_each(item.json, '$.sockets.socketEntries') socket
+        WHERE weapon.random_roll = 1 AND (
+            weapon.hash IN (SELECT hash FROM temp.changed_hashes)
+            OR json_extract(item.json, '$.defaultDamageTypeHash') IN (SELECT hash FROM temp.changed_hashes)
+            OR json_extract(socket.value, '$.randomizedPlugSetHash') IN (SELECT hash FROM temp.changed_hashes)
+            OR json_extract(socket.value, '$.reusablePlugSetHash') IN (SELECT hash FROM temp.changed_hashes))"""))
+
+    # weapons that lost their random rolls or were removed
+    changed_weapons.update(con.execute(f"""
+        SELECT prev.hash, prev.display_name FROM old.{WEAPON_INDEX_TABLE} prev
+        WHERE prev.random_roll = 1 AND NOT EXISTS (
+            SELECT 1 FROM main.{WEAPON_INDEX_TABLE} weapon WHERE weapon.id = prev.id AND weapon.random_roll = 1)"""))
+    return changed_weapons
+
+
+def ensure_weapon_index(db_path: str):
+    """
+    builds the weapon name index if the game database does not contain it yet
+
+    :param db_path: path of the game database
+    """
+    con = sqlite3.connect(db_path)
+    try:
+        exists: bool = has_weapon_index(con)
+    finally:
+        con.close()
+
+    if not exists:
+        logging.info('weapon index missing; commence build')
+        build_weapon_index(db_path)
+
+
+def is_random_rolled_weapon(item_type: int, json_string: str) -> bool:
+    """
+    :param item_type: type of item encoded as Integer value
+    :param json_string: json-formatted item entry of the game database
+    :return: True if the item is a weapon with at least 1 random perk socket, False if it isn't
+    """
+    if item_type != ITEM_TYPE_WEAPON:
+        return False
+
+    try:
+        weapon: Weapon = Weapon(json_string=json_string)
+    except (KeyError, IndexError, TypeError):
+        return False
+
+    return weapon.has_random_roll()
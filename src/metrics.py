@@ -0,0 +1,231 @@
+import bisect
+import logging
+from abc import ABC, abstractmethod
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from aiohttp import web
+
+# 0 disables the metrics endpoint
+METRICS_PORT: int = int(os.environ.get('RAHOOL_METRICS_PORT', 0))
+METRICS_HOST: str = os.environ.get('RAHOOL_METRICS_HOST', '127.0.0.1')
+# seconds; fine grained below 10ms for the in-memory stages
+LATENCY_BUCKETS: tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+LabelValues = tuple[str, ...]
+
+
+class Metric(ABC):
+    """
+    Base of all metrics; values are kept per combination of label values and may be updated from any thread.
+    """
+    name: str
+    description: str
+    label_names: tuple[str, ...]
+    type: str = 'untyped'
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+        """
+        :param name: metric name, registered in the module registry
+        :param description: help text
+        :param label_names: names of the labels every update has to pass
+        """
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def get_label_values(self, labels: dict[str, str]) -> LabelValues:
+        """
+        :param labels: value of every label of the metric by label name
+        :return: the label values in the order of the metric's label names
+        :raises KeyError: if a label is missing
+        """
+        return tuple(str(labels[label_name]) for label_name in self.label_names)
+
+    def format_labels(self, label_values: LabelValues, extra: str = '') -> str:
+        """
+        :param label_values: label values in the order of the metric's label names
+        :param extra: additional, already formatted label pair, e.g. a histogram bucket bound
+        :return: the labels in the exposition format, empty if there are none
+        """
+        pairs: list[str] = [f'{name}="{value}"' for name, value in zip(self.label_names, label_values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    @abstractmethod
+    def collect(self) -> list[str]:
+        """
+        :return: one sample line per combination of label values in the exposition format
+        """
+
+    def render(self) -> str:
+        """
+        :return: help, type and samples of the metric in the exposition format
+        """
+        return '\n'.join([f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type}'] + self.collect())
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+        super().__init__(name, description, label_names)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        :param amount: amount to increase the counter by
+        :param labels: value of every label of the metric by label name
+        """
+        key: LabelValues = self.get_label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """
+        :param labels: value of every label of the metric by label name
+        :return: current value of the counter
+        """
+        return self._values.get(self.get_label_values(labels), 0)
+
+    def collect(self) -> list[str]:
+        """
+        :return: the value of every combination of label values
+        """
+        with self._lock:
+            return [f'{self.name}{self.format_labels(key)} {value}' for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, description: str, function: Callable[[], float]):
+        """
+        :param function: reads the current value when the metric is collected
+        """
+        super().__init__(name, description)
+        self.function = function
+
+    def collect(self) -> list[str]:
+        """
+        :return: the current value
+        """
+        return [f'{self.name} {self.function()}']
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        :param buckets: upper bounds of the buckets, +Inf is added
+        """
+        super().__init__(name, description, label_names)
+        self.buckets = buckets
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        """
+        :param value: observed value, e.g. a duration in seconds
+        :param labels: value of every label of the metric by label name
+        """
+        key: LabelValues = self.get_label_values(labels)
+        i: int = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts: list[int] = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[i] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """
+        observes the duration of the enclosed block in seconds, also if it raises
+        """
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> list[str]:
+        """
+        :return: cumulative bucket counts, sum and count of every combination of label values
+        """
+        lines: list[str] = []
+        with self._lock:
+            for key, counts in self._counts.items():
+                cumulative: int = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le: str = '+Inf' if bound == float('inf') else repr(bound)
+                    bucket_labels: str = self.format_labels(key, f'le="{le}"')
+                    lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+                lines.append(f'{self.name}_sum{self.format_labels(key)} {self._sums[key]}')
+                lines.append(f'{self.name}_count{self.format_labels(key)} {cumulative}')
+        return lines
+
+
+registry: list[Metric] = []
+
+stage_seconds = Histogram('rahool_stage_seconds', 'duration of the stages of a /perks request', ('stage',))
+request_seconds = Histogram('rahool_request_seconds', 'duration of /perks requests including the upload',
+                            ('result',))
+cache_requests = Counter('rahool_cache_requests_total', 'lookups per cache and result', ('cache', 'result'))
+coalesced_requests = Counter('rahool_coalesced_requests_total',
+                             'requests answered by awaiting a render already in progress')
+
+
+def span(stage: str):
+    """
+    :param stage: name of the stage
+    :return: context manager observing the duration of the enclosed block as the stage
+    """
+    return stage_seconds.time(stage=stage)
+
+
+def count_cache(cache: str, hit: bool):
+    """
+    :param cache: name of the cache
+    :param hit: True if the lookup was served from the cache, False if it wasn't
+    """
+    cache_requests.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def render_metrics() -> str:
+    """
+    :return: all registered metrics in the Prometheus text exposition format
+    """
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+_runner: Optional[web.AppRunner] = None
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """
+    serves /metrics on the running event loop, unless the port is 0 or the server runs already
+
+    :param host: interface to listen on
+    :param port: port to listen on
+    """
+    global _runner
+    if port == 0 or _runner is not None:
+        return
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logging.info(f'metrics served at http://{host}:{port}/metrics')
@@ -0,0 +1,212 @@
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from PIL import Image
+from assetCache import decode_icon
+
+PERK_ATLAS_PATH = 'resources/perk_atlas.bin'
+PERK_ICON_SIZE: tuple[int, int] = (40, 40)
+ATLAS_DOWNLOAD_THREADS: int = int(os.environ.get('RAHOOL_ATLAS_THREADS', 16))
+
+# magic, format version, icon width, icon height, perk count, slot count, pixel data offset, manifest md5
+HEADER = struct.Struct('<4sHHHIII32s')
+# perk hash, slot
+INDEX_ENTRY = struct.Struct('<II')
+PATH_LENGTH = struct.Struct('<H')
+ATLAS_MAGIC = b'RPAT'
+ATLAS_FORMAT_VERSION = 1
+
+
+class PerkAtlas:
+    """
+    Memory mapped atlas of perk icons, already converted and resized for rendering.
+    Every process maps the same file, so the operating system keeps a single copy of the pixels in memory.
+
+    Layout: header, perk hash -> slot index, icon path of every slot, RGBA pixels of every slot.
+    """
+    path: str
+    manifest_md5: str
+    icon_size: tuple[int, int]
+    offsets: dict[int, int]
+    icon_paths: dict[int, str]
+
+    def __init__(self, path: str = PERK_ATLAS_PATH):
+        """
+        :param path: atlas file to map
+        :raises OSError: if the file can not be read
+        :raises ValueError: if the file is no atlas of the supported format version
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < HEADER.size:
+            raise ValueError(f'{path} is truncated')
+        magic, version, width, height, n_perks, n_slots, data_offset, md5 = HEADER.unpack_from(self._mmap)
+        if magic != ATLAS_MAGIC or version != ATLAS_FORMAT_VERSION:
+            raise ValueError(f'{path} is no perk atlas of format version {ATLAS_FORMAT_VERSION}')
+        self.manifest_md5 = md5.rstrip(b'\0').decode()
+        self.icon_size = (width, height)
+        icon_bytes: int = width * height * 4
+        if len(self._mmap) != data_offset + n_slots * icon_bytes:
+            raise ValueError(f'{path} is truncated')
+
+        position: int = HEADER.size
+        slot_paths: list[str] = []
+        paths_offset: int = position + n_perks * INDEX_ENTRY.size
+        for _ in range(n_slots):
+            length, = PATH_LENGTH.unpack_from(self._mmap, paths_offset)
+            paths_offset += PATH_LENGTH.size
+            slot_paths.append(self._mmap[paths_offset:paths_offset + length].decode())
+            paths_offset += length
+
+        self.offsets = {}
+        self.icon_paths = {}
+        for perk_hash, slot in INDEX_ENTRY.iter_unpack(self._mmap[position:position + n_perks * INDEX_ENTRY.size]):
+            self.offsets[perk_hash] = data_offset + slot * icon_bytes
+            self.icon_paths[perk_hash] = slot_paths[slot]
+        self._pixels = memoryview(self._mmap)
+        self._icon_bytes = icon_bytes
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_icon(self, perk_hash: int, icon_path: str) -> Optional[Image.Image]:
+        """
+        :param perk_hash: hash of the perk
+        :param icon_path: bungie.net path of the perk's icon, guards against icons changed since the atlas was built
+        :return: read-only view of the icon in the atlas, None if the atlas does not contain it
+        """
+        offset: Optional[int] = self.offsets.get(perk_hash)
+        if offset is None or self.icon_paths[perk_hash] != icon_path:
+            return None
+        return Image.frombuffer('RGBA', self.icon_size, self._pixels[offset:offset + self._icon_bytes],
+                                'raw', 'RGBA', 0, 1)
+
+
+def write_perk_atlas(path: str, manifest_md5: str, icons: dict[int, tuple[str, Image.Image]],
+                     icon_size: tuple[int, int] = PERK_ICON_SIZE):
+    """
+    writes an atlas, replacing the file atomically
+
+    :param path: file to write to
+    :param manifest_md5: md5 sum of the game database the perks are from
+    :param icons: icon path and icon of every perk, perks sharing a path share a slot
+    :param icon_size: width and height of every icon
+    """
+    slots: dict[str, int] = {}
+    slot_icons: list[Image.Image] = []
+    index: list[tuple[int, int]] = []
+    for perk_hash, (icon_path, icon) in sorted(icons.items()):
+        if icon_path not in slots:
+            slots[icon_path] = len(slot_icons)
+            slot_icons.append(icon)
+        index.append((perk_hash, slots[icon_path]))
+
+    paths: bytes = b''.join(PATH_LENGTH.pack(len(encoded)) + encoded
+                            for encoded in (icon_path.encode() for icon_path in slots))
+    data_offset: int = HEADER.size + len(index) * INDEX_ENTRY.size + len(paths)
+
+    directory: str = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(HEADER.pack(ATLAS_MAGIC, ATLAS_FORMAT_VERSION, icon_size[0], icon_size[1], len(index),
+                                   len(slot_icons), data_offset, manifest_md5.encode()))
+            file.write(b''.join(INDEX_ENTRY.pack(perk_hash, slot) for perk_hash, slot in index))
+            file.write(paths)
+            for icon in slot_icons:
+                file.write(icon.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def build_perk_atlas(perk_icon_paths: dict[int, str], manifest_md5: str, path: str = PERK_ATLAS_PATH) -> int:
+    """
+    downloads, converts and resizes the icons of the given perks into an atlas, skipping unavailable icons
+
+    :param perk_icon_paths: bungie.net icon path of every perk
+    :param manifest_md5: md5 sum of the game database the perks are from
+    :param path: file to write to
+    :return: number of perks in the atlas
+    """
+    unique_paths: list[str] = list(dict.fromkeys(icon_path for icon_path in perk_icon_paths.values() if icon_path))
+
+    def load(icon_path: str) -> Optional[Image.Image]:
+        try:
+            return decode_icon(icon_path, PERK_ICON_SIZE)
+        except OSError as e:
+            logging.warning(f'perk icon {icon_path} left out of the atlas: {e}')
+            return None
+
+    with ThreadPoolExecutor(max_workers=ATLAS_DOWNLOAD_THREADS, thread_name_prefix='rahool-atlas') as pool:
+        loaded: dict[str, Optional[Image.Image]] = dict(zip(unique_paths, pool.map(load, unique_paths)))
+
+    icons: dict[int, tuple[str, Image.Image]] = {perk_hash: (icon_path, loaded[icon_path])
+                                                 for perk_hash, icon_path in perk_icon_paths.items()
+                                                 if loaded.get(icon_path) is not None}
+    write_perk_atlas(path, manifest_md5, icons)
+    return len(icons)
+
+
+def ensure_perk_atlas():
+    """
+    (re)builds the atlas from every currently rollable perk of the installed game database unless it is up to date.
+    Blocks on network and disk I/O.
+    """
+    from catalog import CATALOG_ENABLED, get_catalog, build_catalog
+    from readDB import manifest_pool, curation_pool
+
+    with _atlas_lock:
+        connection = manifest_pool.get_connection()
+        version: Optional[str] = manifest_pool.version
+        atlas: Optional[PerkAtlas] = get_perk_atlas()
+        if atlas is not None and atlas.manifest_md5 == version:
+            return
+
+        start: float = time.perf_counter()
+        # the catalog projects exactly the perks /perks can display
+        if CATALOG_ENABLED:
+            catalog = get_catalog()
+        else:
+            catalog = build_catalog(connection, curation_pool.get_connection())
+        perk_icon_paths: dict[int, str] = {perk_hash: icon_path for perk_hash, (_, icon_path, _) in
+                                           catalog.perks.items()}
+        n_perks: int = build_perk_atlas(perk_icon_paths, version or '')
+        logging.info(f'perk atlas built in {time.perf_counter() - start:.1f}s; {n_perks} of {len(perk_icon_paths)} '
+                     f'perks, {os.path.getsize(PERK_ATLAS_PATH) / 2**20:.1f} MiB')
+
+
+_atlas: Optional[PerkAtlas] = None
+_atlas_stat: Optional[tuple[int, int]] = None
+_atlas_lock = threading.Lock()
+
+
+def get_perk_atlas() -> Optional[PerkAtlas]:
+    """
+    :return: the atlas, mapped again whenever the file was replaced, None if there is no usable atlas
+    """
+    global _atlas, _atlas_stat
+    try:
+        stat = os.stat(PERK_ATLAS_PATH)
+    except FileNotFoundError:
+        return None
+
+    if (stat.st_mtime_ns, stat.st_size) != _atlas_stat:
+        try:
+            # a replaced mapping stays valid for icons still referencing it
+            _atlas = PerkAtlas(PERK_ATLAS_PATH)
+        except (OSError, ValueError) as e:
+            logging.warning(f'perk atlas unusable: {e}')
+            _atlas = None
+        _atlas_stat = (stat.st_mtime_ns, stat.st_size)
+    return _atlas
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import Counter
+
+POPULARITY_PATH = 'resources/popularity.json'
+PREWARM_COUNT: int = int(os.environ.get('RAHOOL_PREWARM_COUNT', 20))
+
+
+class PopularityCounter:
+    """
+    Counts /perks requests per weapon hash. Counts are kept in memory and written to disk by save(),
+    so they survive restarts; weapon hashes stay the same across manifest versions.
+    """
+    path: str
+    counts: Counter
+
+    def __init__(self, path: str = POPULARITY_PATH):
+        """
+        :param path: file the counts are persisted in
+        """
+        self.path = path
+        self.counts = Counter()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        reads the persisted counts, starting from zero if there are none or they are unreadable
+        """
+        try:
+            with open(self.path) as file:
+                self.counts = Counter({int(weapon_hash): count for weapon_hash, count in json.load(file).items()})
+        except FileNotFoundError:
+            return
+        except (ValueError, AttributeError) as e:
+            logging.warning(f'ignoring unreadable request counts in {self.path}: {e}')
+
+    def record(self, weapon_hash: str):
+        """
+        :param weapon_hash: hash of the requested weapon
+        """
+        with self._lock:
+            self.counts[int(weapon_hash)] += 1
+            self._dirty = True
+
+    def top(self, n: int = PREWARM_COUNT) -> list[int]:
+        """
+        :param n: number of weapons
+        :return: hashes of the n most requested weapons, most requested first
+        """
+        with self._lock:
+            return [weapon_hash for weapon_hash, _ in self.counts.most_common(n)]
+
+    def save(self):
+        """
+        writes the counts atomically if they changed since the last save
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            written: Counter = self.counts.copy()
+        content: str = json.dumps({str(weapon_hash): count for weapon_hash, count in written.items()})
+
+        directory: str = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write(content)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            # requests recorded while writing are saved next time
+            if self.counts == written:
+                self._dirty = False
+
+
+popularity = PopularityCounter()
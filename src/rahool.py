@@ -1,15 +1,40 @@
+import asyncio
+import io
 import logging
 import os
+import time
+from typing import Callable, Optional
 import disnake
 from disnake.ext import commands, tasks
 from APIrequests import check_update
-from commandCallFunctions import generate_perk_information_image
+from commandCallFunctions import generate_perk_information_image, prewarm_renders
+from assetFetcher import asset_fetcher
+from catalog import CATALOG_ENABLED, get_catalog
+from workerPools import shutdown_pools
+from weaponSearch import refresh_search_index, complete_weapon_name
+from popularity import popularity
+from perkAtlas import ensure_perk_atlas
+from metrics import span, request_seconds, start_metrics_server
 from customExceptions import NoSuchWeaponError, NoRandomRollsError
 
 BOT_PFP = 'https://cdn.discordapp.com/app-icons/725485079438032916/8cfe42f2a6930a82300aba44ef390306.png?size=512'
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
 
-rahool = commands.Bot(command_prefix='e/')
+
+class Rahool(commands.Bot):
+    """
+    The bot, releasing the resources it holds on its event loop when it shuts down.
+    """
+    async def close(self):
+        """
+        closes the asset fetcher's session on the bot's event loop before disconnecting
+        """
+        await asset_fetcher.close()
+        await super().close()
+
+
+rahool = Rahool(command_prefix='e/')
+prewarm_task: Optional[asyncio.Task] = None
 
 logging.basicConfig(level=logging.INFO,
                     format='%(levelname)s|%(module)s|%(funcName)s|%(message)s|%(asctime)s',
@@ -20,14 +45,50 @@ logging.basicConfig(level=logging.INFO,
 @rahool.event
 async def on_ready():
     update_loop.start()
+    await start_metrics_server()
     logging.info("Bot online")
     await rahool.change_presence(activity=disnake.Activity(type=disnake.ActivityType.watching, name="Weapon Rolls"))
 
 
+async def run_update_step(name: str, function: Callable[[], object]):
+    """
+    runs a blocking step of the update loop off the event loop; a failure is logged instead of raised,
+    so it neither skips the remaining steps nor stops the loop for good
+
+    :param name: name of the step for the log
+    :param function: the step
+    """
+    try:
+        await asyncio.to_thread(function)
+    except Exception as e:
+        logging.error(f'{name} failed: {e}')
+
+
 @tasks.loop(hours=1)
 async def update_loop():
+    global prewarm_task
     logging.info("checking for updates")
-    check_update()
+    updated: bool = False
+    # downloading and installing a manifest blocks, keep it off the event loop
+    try:
+        updated = await asyncio.to_thread(check_update)
+    except Exception as e:
+        logging.error(f'update failed, keeping current manifest: {e}')
+    # autocomplete only reads the in-memory index, build it before the first keystroke
+    await run_update_step('search index build', refresh_search_index)
+    if CATALOG_ENABLED:
+        # (re)build the in-memory catalog now instead of on the first /perks call
+        await run_update_step('catalog build', get_catalog)
+
+    await run_update_step('saving request counts', popularity.save)
+    # renders are cold after a restart or an update, render the most requested weapons before they are requested
+    if updated or update_loop.current_loop == 0:
+        if prewarm_task is not None:
+            prewarm_task.cancel()
+        prewarm_task = asyncio.create_task(prewarm_renders(popularity.top()))
+
+    # installing a manifest builds the perk atlas, this covers installs from before the atlas existed
+    await run_update_step('perk atlas build', ensure_perk_atlas)
 
 
 @rahool.slash_command(description="command syntax help")
@@ -62,20 +123,37 @@ async def perks(inter, weapon_name: str = commands.Param(name="weapon")):
     weapon_name: :class:`str`
         The queried weapon
     """
-    # temporary response to satisfy discord's response time limit
-    await inter.response.defer()
+    start: float = time.perf_counter()
+    result: str = 'error'
+    try:
+        # temporary response to satisfy discord's response time limit
+        await inter.response.defer()
+        result = await answer_perks(inter, weapon_name)
+    finally:
+        request_seconds.observe(time.perf_counter() - start, result=result)
+
+
+async def answer_perks(inter, weapon_name: str) -> str:
+    """
+    sends the perk information image of a weapon or an error embed as followup
 
+    :param inter: the deferred interaction
+    :param weapon_name: the queried weapon
+    :return: the request's outcome as metrics label
+    """
     try:
-        path_to_image: str = await generate_perk_information_image(weapon_name)
-    except NoSuchWeaponError:
+        image, file_name = await generate_perk_information_image(weapon_name)
+    except NoSuchWeaponError as e:
         error = disnake.Embed(
             title="Error",
             description="This weapon does not exist.\n"
                         "Please check for typos or check /help",
             colour=disnake.Colour.red()
         )
+        if e.suggestions:
+            error.add_field(name='Did you mean', value='\n'.join(e.suggestions))
         await inter.followup.send(content=None, embed=error)
-        return
+        return 'no_such_weapon'
     except NoRandomRollsError:
         error = disnake.Embed(
             title="Error",
@@ -84,12 +162,23 @@ async def perks(inter, weapon_name: str = commands.Param(name="weapon")):
             colour=disnake.Colour.red()
         )
         await inter.followup.send(content=None, embed=error)
-        return
+        return 'no_random_rolls'
+
+    with span('upload'):
+        await inter.followup.send(file=disnake.File(io.BytesIO(image), filename=file_name))
+    return 'ok'
 
-    image = disnake.File(path_to_image)
 
-    await inter.followup.send(file=image)
+@perks.autocomplete("weapon")
+async def weapon_autocomplete(inter, user_input: str):
+    return complete_weapon_name(user_input)
 
-    os.remove(path_to_image)
 
-rahool.run(BOT_TOKEN)
+# render processes re-import this module, only the main process runs the bot
+if __name__ == '__main__':
+    try:
+        rahool.run(BOT_TOKEN)
+    finally:
+        popularity.save()
+        shutdown_pools()
+
@@ -1,13 +1,61 @@
+import hashlib
+import json
 import sqlite3
 import logging
 import os
-from APIrequests import get_manifest
+import threading
+from typing import Optional
+from APIrequests import get_manifest, read_manifest_md5
 from readJSON import find_weapon, get_damage_type_icon_url
+from manifestIndex import ensure_weapon_index, normalize_name
+from connectionPool import ConnectionPool
 from helperClasses import Weapon
 from customExceptions import NoSuchWeaponError, NoGodRollError
 
+MANIFEST_PATH = 'resources/Manifest.content'
+CURATION_PATH = 'resources/CurationRolls.db'
 
-# connect to Manifest.content and query all items named item_name
+
+def prepare_manifest():
+    """
+    downloads the game database if it is missing and makes sure it contains the derived weapon index
+    """
+    if not os.path.isfile(MANIFEST_PATH):
+        # call API GET request for the game-manifest
+        get_manifest()
+
+    ensure_weapon_index(MANIFEST_PATH)
+    if manifest_pool.version is None:
+        manifest_pool.version = read_manifest_md5()
+
+
+manifest_pool = ConnectionPool(MANIFEST_PATH, prepare=prepare_manifest)
+curation_pool = ConnectionPool(CURATION_PATH)
+
+_curation_stat: Optional[tuple[int, int]] = None
+_curation_lock = threading.Lock()
+
+
+def refresh_curation() -> int:
+    """
+    makes pooled readers reopen the curated rolls database if the file changed since the last call
+
+    :return: generation of the curation connection pool, increased by every change of the file
+    """
+    global _curation_stat
+
+    stat = os.stat(CURATION_PATH)
+    if (stat.st_mtime_ns, stat.st_size) != _curation_stat:
+        with _curation_lock:
+            if (stat.st_mtime_ns, stat.st_size) != _curation_stat:
+                if _curation_stat is not None:
+                    logging.info('curation data changed; reloading')
+                    curation_pool.swap()
+                _curation_stat = (stat.st_mtime_ns, stat.st_size)
+    return curation_pool.generation
+
+
+# query the weapon name index of Manifest.content for all items named item_name
 def query_weapon(item_name: str) -> Weapon:
     """
     get weapon data by name from game database
@@ -17,98 +65,120 @@ def query_weapon(item_name: str) -> Weapon:
     :raises IOError: when database query fails
     :raises NoSuchWeaponError: when query for weapon yields no results
     """
-    if not os.path.isfile(r'resources/Manifest.content'):
-        # call API GET request for the game-manifest
-        get_manifest()
-
-    con = sqlite3.connect('resources/Manifest.content')
-    cur = con.cursor()
+    cur = manifest_pool.get_connection().cursor()
     try:
         cur.execute("""
                 SELECT
-                    json_extract(DestinyInventoryItemDefinition.json, '$')
+                    DestinyInventoryItemDefinition.json, WeaponNameIndex.item_type, WeaponNameIndex.random_roll
                 FROM
-                    DestinyInventoryItemDefinition, json_tree(DestinyInventoryItemDefinition.json, '$')
+                    WeaponNameIndex JOIN DestinyInventoryItemDefinition
+                    ON DestinyInventoryItemDefinition.id = WeaponNameIndex.id
                 WHERE
-                    json_tree.key = 'name' AND UPPER(json_tree.value) LIKE UPPER(?)""", (item_name,))
+                    WeaponNameIndex.name = ?
+                ORDER BY
+                    WeaponNameIndex.id""", (normalize_name(item_name),))
+        item_list: list[tuple[str, int, int]] = cur.fetchall()
     except sqlite3.Error as e:
         logging.error(f'"{item_name}" query caused {e}')
         raise IOError
 
-    item_list: list[list[str]] = cur.fetchall()
     if len(item_list) == 0:
         logging.warning(f'"{item_name}" query did not yield db result')
         raise NoSuchWeaponError
-    con.close()
 
     return find_weapon(item_list)
 
 
-# connect to Manifest.content and query the plug set with the given hash
-def query_plug_set(plug_hash: int) -> str:
+def hash_to_id(item_hash) -> int:
+    """
+    converts a manifest hash into the primary key of its database row
+
+    :param item_hash: unsigned 32-bit hash as int or String
+    :return: signed 32-bit form of the hash as stored in the 'id' column
+    """
+    item_id: int = int(item_hash)
+    if item_id >= 2**31:
+        item_id -= 2**32
+    return item_id
+
+
+def query_weapon_by_hash(weapon_hash) -> Weapon:
+    """
+    get weapon data by hash from game database
+
+    :param weapon_hash: the weapon's hash value
+    :return: the requested Weapon
+    :raises IOError: when database query fails
+    :raises NoSuchWeaponError: when the game database does not contain the weapon
+    """
+    weapons: dict[int, str] = query_definitions('DestinyInventoryItemDefinition', [int(weapon_hash)])
+    if int(weapon_hash) not in weapons:
+        raise NoSuchWeaponError
+
+    return Weapon(weapons[int(weapon_hash)])
+
+
+def query_definitions(table: str, item_hashes: list[int]) -> dict[int, str]:
     """
-    get plug set data by plug set hash from game database
+    get the definitions of several items of one table with a single query
 
-    :param plug_hash: plug set's hash value
-    :return: first query result as String
+    :param table: table of the game database
+    :param item_hashes: the items' hash values
+    :return: json-formatted definitions by hash, missing items are left out
     :raises IOError: when database query fails
     """
-    con = sqlite3.connect('resources/Manifest.content')
-    cur = con.cursor()
+    # the ids are bound as one json array, which keeps the statement the same for any number of hashes
+    item_ids: str = json.dumps([hash_to_id(item_hash) for item_hash in dict.fromkeys(item_hashes)])
+
+    cur = manifest_pool.get_connection().cursor()
     try:
-        cur.execute("""
+        cur.execute(f"""
             SELECT
-                json_extract(DestinyPlugSetDefinition.json, '$')
+                id, json
             FROM
-                DestinyPlugSetDefinition, json_tree(DestinyPlugSetDefinition.json, '$')
+                {table}
             WHERE
-                json_tree.key = 'hash' AND json_tree.value = ?""", (plug_hash,))
+                id IN (SELECT value FROM json_each(?))""", (item_ids,))
+        rows: list[tuple[int, str]] = cur.fetchall()
     except sqlite3.Error as e:
-        logging.error(f'"{plug_hash}" query caused {e}')
-        raise
-    plug_set: list[str] = cur.fetchone()
-    if len(plug_set) == 0:
-        logging.warning(f'"{plug_hash}" query did not yield db result')
-    con.close()
+        logging.error(f'{table} query caused {e}')
+        raise IOError
 
-    return plug_set[0]
+    return {item_id % 2**32: json_string for item_id, json_string in rows}
 
 
-# connect to Manifest.content and query the perk with the given hash
-def query_perks(perk_hashes: list[int]) -> list[str]:
+# query Manifest.content for the plug sets with the given hashes
+def query_plug_sets(plug_set_hashes: list[int]) -> dict[int, str]:
     """
-    get perk information for all perk hashes passed without maintaining the original order
-    :param perk_hashes: the perk's hash values
-    :return: list of perk data as List of json-formatted Strings
-    :raises IOError: when database query fails
+    get plug set data of all plug set hashes passed from game database
+
+    :param plug_set_hashes: the plug sets' hash values
+    :return: plug set data as json-formatted Strings by hash
+    :raises IOError: when database query fails or a plug set does not exist
     """
-    con = sqlite3.connect('resources/Manifest.content')
-    cur = con.cursor()
-    try:
-        if len(perk_hashes) > 1:
-            cur.execute("""
-                SELECT
-                    json_extract(DestinyInventoryItemDefinition.json, '$')
-                FROM
-                    DestinyInventoryItemDefinition, json_tree(DestinyInventoryItemDefinition.json, '$')
-                WHERE
-                    json_tree.key = 'hash' AND json_tree.value IN {}""".format(tuple(map(int, perk_hashes))))
-        else:
-            cur.execute("""
-                SELECT
-                    json_extract(DestinyInventoryItemDefinition.json, '$')
-                FROM
-                    DestinyInventoryItemDefinition, json_tree(DestinyInventoryItemDefinition.json, '$')
-                WHERE
-                    json_tree.key = 'hash' AND json_tree.value = ?""", (perk_hashes[0], ))
-    except sqlite3.Error as e:
-        logging.error(f'perk query caused {e}')
+    plug_sets: dict[int, str] = query_definitions('DestinyPlugSetDefinition', plug_set_hashes)
+
+    missing: list[int] = [plug_set_hash for plug_set_hash in plug_set_hashes if plug_set_hash not in plug_sets]
+    if missing:
+        logging.warning(f'plug set query did not yield db result for {missing}')
         raise IOError
-    perks: list[str] = cur.fetchall()
-    con.close()
 
-    if len(perks) == 0:
-        logging.warning(f'"perk query did not yield db result')
+    return plug_sets
+
+
+# query Manifest.content for the perks with the given hashes
+def query_perks(perk_hashes: list[int]) -> dict[int, str]:
+    """
+    get perk information of all perk hashes passed from game database
+
+    :param perk_hashes: the perks' hash values
+    :return: perk data as json-formatted Strings by hash, unknown perks are left out
+    :raises IOError: when database query fails
+    """
+    perks: dict[int, str] = query_definitions('DestinyInventoryItemDefinition', perk_hashes)
+
+    if len(perks) == 0 and len(perk_hashes) > 0:
+        logging.warning('perk query did not yield db result')
 
     return perks
 
@@ -122,17 +192,16 @@ def query_god_roll(weapon_hash: str) -> str:
     :raises IOError: when database query fails
     :raises NoGodRollError: when query yields no results
     """
-    con = sqlite3.connect('resources/CurationRolls.db')
-    cur = con.cursor()
+    cur = curation_pool.get_connection().cursor()
 
     try:
         cur.execute("""
-        SELECT
-                    json_extract(Weapons.json, '$')
+                SELECT
+                    json
                 FROM
-                    Weapons, json_tree(Weapons.json, '$')
+                    Weapons
                 WHERE
-                    json_tree.key = 'hash' AND json_tree.value = ?""", (str(weapon_hash), ))
+                    hash = ?""", (int(weapon_hash), ))
     except sqlite3.Error as e:
         logging.error(f'god roll query caused {e}')
         raise IOError
@@ -145,29 +214,46 @@ def query_god_roll(weapon_hash: str) -> str:
     return god_rolls[0]
 
 
+def query_curation_digests() -> dict[int, str]:
+    """
+    get a content digest of every weapon's recommended perks
+
+    :return: sha1 of the recommendation data by weapon hash
+    :raises IOError: when database query fails
+    """
+    try:
+        rows = curation_pool.get_connection().execute('SELECT hash, json FROM Weapons').fetchall()
+    except sqlite3.Error as e:
+        logging.error(f'curation digest query caused {e}')
+        raise IOError
+
+    return {weapon_hash: hashlib.sha1(json_string.encode()).hexdigest() for weapon_hash, json_string in rows}
+
+
 def query_damage_type(dmg_hash: str) -> str:
     """
     get damage type data by damage type hash from game database
     :param dmg_hash: hash of the damage type
     :return: damage type icon url as String
+    :raises IOError: when database query fails
     """
-    con = sqlite3.connect('resources/Manifest.content')
-    cur = con.cursor()
+    cur = manifest_pool.get_connection().cursor()
 
     try:
         cur.execute("""
                 SELECT
-                    json_extract(DestinyDamageTypeDefinition.json, '$')
+                    json
                 FROM
-                    DestinyDamageTypeDefinition, json_tree(DestinyDamageTypeDefinition.json, '$')
+                    DestinyDamageTypeDefinition
                 WHERE
-                    json_tree.key = 'hash' AND json_tree.value = ?""", (dmg_hash,))
+                    id = ?""", (hash_to_id(dmg_hash),))
+        dmg_type: tuple[str] = cur.fetchone()
     except sqlite3.Error as e:
         logging.error(f'"{dmg_hash}" query caused {e}')
         raise IOError
 
-    dmg_type: list[str] = cur.fetchone()
-    if len(dmg_type) == 0:
+    if dmg_type is None:
         logging.warning(f'"{dmg_hash}" did not yield db result')
+        raise IOError
 
     return get_damage_type_icon_url(dmg_type[0])
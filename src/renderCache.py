@@ -0,0 +1,133 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from helperClasses import Weapon
+from manifestIndex import ManifestDiff
+from readDB import manifest_pool, query_curation_digests, refresh_curation
+from createImages import RENDER_TEMPLATE_VERSION
+
+RENDER_CACHE_MAX_BYTES: int = int(os.environ.get('RAHOOL_RENDER_CACHE_MB', 64)) * 1024 * 1024
+
+# (weapon hash, manifest md5, curation digest, render template version)
+RenderKey = tuple[str, str, str, int]
+
+
+class RenderCache:
+    """
+    In-memory LRU of encoded perk images bounded by their total size.
+    Keys contain the manifest and curation versions, so renders of outdated data are never served.
+    """
+    max_bytes: int
+    size: int
+
+    def __init__(self, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        """
+        :param max_bytes: size limit of all cached images
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[RenderKey, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: RenderKey) -> Optional[bytes]:
+        """
+        :param key: render key of the weapon
+        :return: the encoded image, None on a miss
+        """
+        with self._lock:
+            image: Optional[bytes] = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def contains(self, key: RenderKey) -> bool:
+        """
+        :param key: render key of the weapon
+        :return: True if the image is cached, False if it isn't; neither counts as a hit or miss
+        """
+        return key in self._entries
+
+    def put(self, key: RenderKey, image: bytes):
+        """
+        :param key: render key of the weapon
+        :param image: the encoded image
+        """
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous: Optional[bytes] = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = image
+            self.size += len(image)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def carry_over(self, diff: Optional[ManifestDiff]):
+        """
+        re-keys renders of weapons unaffected by a manifest update to the new manifest version
+        and drops all other renders of older versions
+
+        :param diff: differences to the previously installed manifest, None drops every outdated render
+        """
+        version: Optional[str] = manifest_pool.version
+        changed: set[str] = {str(weapon_hash) for weapon_hash in diff.changed_weapons} if diff is not None else set()
+
+        with self._lock:
+            entries: OrderedDict[RenderKey, bytes] = OrderedDict()
+            for (weapon_hash, manifest_md5, curation_digest, template), image in self._entries.items():
+                if manifest_md5 != version and (diff is None or weapon_hash in changed):
+                    continue
+                entries[(weapon_hash, version, curation_digest, template)] = image
+            dropped: int = len(self._entries) - len(entries)
+            self._entries = entries
+            self.size = sum(len(image) for image in entries.values())
+
+        logging.info(f'render cache kept {len(entries)} images, dropped {dropped}')
+
+
+render_cache = RenderCache()
+
+_curation_digests: dict[int, str] = {}
+_curation_generation: int = -1
+_curation_lock = threading.Lock()
+
+
+def get_curation_digest(weapon_hash: str) -> str:
+    """
+    :param weapon_hash: weapon's hash value
+    :return: digest of the weapon's recommended perks, empty if there are none
+    """
+    global _curation_digests, _curation_generation
+
+    generation: int = refresh_curation()
+    if generation != _curation_generation:
+        with _curation_lock:
+            if generation != _curation_generation:
+                _curation_digests = query_curation_digests()
+                _curation_generation = generation
+
+    return _curation_digests.get(int(weapon_hash), '')
+
+
+def get_render_key(weapon: Weapon) -> RenderKey:
+    """
+    :param weapon: weapon to render
+    :return: key identifying the weapon's perk image for the installed manifest and curation data
+    """
+    if manifest_pool.version is None:
+        # opening the first connection reads the installed manifest version
+        manifest_pool.get_connection()
+
+    return weapon.get_hash(), manifest_pool.version, get_curation_digest(weapon.get_hash()), RENDER_TEMPLATE_VERSION
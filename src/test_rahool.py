@@ -1,13 +1,39 @@
+import asyncio
+import io
+import json
 import os
+import random
+import shutil
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
-from readDB import query_weapon, query_god_roll
-from readJSON import get_weapon_plug_hashes, get_perks
-from helperClasses import Weapon, PerkColumn, GodRollContainer
+import APIrequests
+import assetCache
+from readDB import query_weapon, query_god_roll, query_plug_sets, hash_to_id
+from readJSON import load_weapon_perks, get_perk_plug_set_hashes
+from helperClasses import Weapon, PlugSet, PerkColumn, GodRollContainer
 from customExceptions import NoSuchWeaponError, NoRandomRollsError
-from commandCallFunctions import generate_perk_information_image
+from commandCallFunctions import generate_perk_information_image, resolve_weapon, find_weapon
+from createImages import create_perk_image
+from weaponSearch import refresh_search_index
+from popularity import PopularityCounter
+from renderCache import render_cache, RENDER_CACHE_MAX_BYTES
+from metrics import coalesced_requests
+from perkAtlas import PerkAtlas, write_perk_atlas
+from catalog import Catalog, save_snapshot, load_snapshot
+from customExceptions import InvalidManifestError
+from APIrequests import download_file, download_manifest, install_manifest
+from manifestIndex import build_weapon_index, update_weapon_index
+from assetCache import AssetCache
 from PIL import Image
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from bungie_stand_in import start_stand_in  # noqa: E402
+from synthetic_manifest import generate  # noqa: E402
+
 
 def pytest_configure(config):
     config.addinivalue_line(
@@ -22,9 +48,34 @@ def test_weapon_query():
     assert query_weapon("Bottom Dollar").get_name() == "Bottom Dollar"
 
 
+def test_weapon_query_ignores_case_and_whitespace():
+    assert query_weapon("  bottom   DOLLAR ").get_name() == "Bottom Dollar"
+
+
+def test_weapon_autocomplete():
+    suggestions: list[str] = refresh_search_index().complete("bottom dol")
+    assert suggestions[0] == "Bottom Dollar"
+
+
+def test_weapon_autocomplete_matches_later_words():
+    assert "Astral Horizon" in refresh_search_index().complete("horizon")
+
+
+def test_misspelled_weapon_resolves():
+    refresh_search_index()
+    assert find_weapon("Botom Doller").get_name() == "Bottom Dollar"
+
+
+def test_unknown_weapon_suggests_similar_names():
+    refresh_search_index()
+    with pytest.raises(NoSuchWeaponError) as e:
+        find_weapon("Horizon")
+    assert "Astral Horizon" in e.value.suggestions
+
+
 async def get_first_perk(weapon_name: str) -> str:
     weapon: Weapon = query_weapon(weapon_name)
-    weapon_perks: list[PerkColumn] = await get_weapon_plug_hashes(weapon.get_socket_set())
+    weapon_perks: list[PerkColumn] = load_weapon_perks(weapon.get_socket_set())
     for col in weapon_perks:
         for perk in col:
             return perk.get_name()
@@ -42,6 +93,21 @@ async def test_perk_query_filter_y1_version(event_loop):
     assert await get_first_perk("Shepherd's Watch") == "Hammer-Forged Rifling"
 
 
+@pytest.mark.perks
+@pytest.mark.asyncio
+async def test_perk_columns_follow_plug_set_order(event_loop):
+    weapon: Weapon = query_weapon("Bottom Dollar")
+    plug_set_hashes: list[int] = get_perk_plug_set_hashes(weapon.get_socket_set())
+    plug_sets: dict[int, str] = query_plug_sets(plug_set_hashes)
+    weapon_perks: list[PerkColumn] = load_weapon_perks(weapon.get_socket_set())
+
+    assert len(weapon_perks) == len(plug_set_hashes)
+    for plug_set_hash, col in zip(plug_set_hashes, weapon_perks):
+        perk_hashes: list[int] = [int(perk.get_hash()) for perk in col]
+        plug_set_order: list[int] = PlugSet(plug_sets[plug_set_hash]).get_perk_hashes()
+        assert perk_hashes == [perk_hash for perk_hash in plug_set_order if perk_hash in perk_hashes]
+
+
 @pytest.mark.perks
 @pytest.mark.asyncio
 async def test_perk_query_test_db_exception(event_loop):
@@ -86,9 +152,200 @@ async def test_image_generation_exotic(event_loop):
     await weapon_image_gen("Hawkmoon")
 
 
+@pytest.mark.perks
+@pytest.mark.asyncio
+async def test_concurrent_image_generation_shares_no_files(event_loop):
+    files_before: set[str] = set(os.listdir())
+    # both weapons share a damage type
+    weapons = [await resolve_weapon("Bottom Dollar"), await resolve_weapon("Thoughtless")]
+    expected: list[bytes] = [create_perk_image(*weapon) for weapon in weapons]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        images: list[bytes] = list(pool.map(lambda i: create_perk_image(*weapons[i % 2]), range(8)))
+
+    assert images == expected * 4
+    assert set(os.listdir()) == files_before
+
+
+@pytest.mark.perks
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_render(event_loop):
+    render_cache.max_bytes = 0
+    try:
+        coalesced_before: float = coalesced_requests.get()
+        results = await asyncio.gather(*(generate_perk_information_image("Astral Horizon") for _ in range(4)))
+    finally:
+        render_cache.max_bytes = RENDER_CACHE_MAX_BYTES
+
+    assert coalesced_requests.get() - coalesced_before == 3
+    assert len({image for image, _ in results}) == 1
+
+
 async def weapon_image_gen(weapon: str):
-    image_name: str = await generate_perk_information_image(weapon)
-    image = Image.open(image_name)
+    image_bytes, _ = await generate_perk_information_image(weapon)
+    image = Image.open(io.BytesIO(image_bytes))
     image.show()
 
-    os.remove(image_name)
+
+def test_request_counts_survive_restart(tmp_path):
+    counter = PopularityCounter(str(tmp_path / 'popularity.json'))
+    for weapon_hash in ['1', '2', '2']:
+        counter.record(weapon_hash)
+    counter.save()
+
+    assert PopularityCounter(str(tmp_path / 'popularity.json')).top(2) == [2, 1]
+
+
+def test_perk_atlas_returns_written_icons(tmp_path):
+    icons = {1: ('/a.png', Image.new('RGBA', (40, 40), (255, 0, 0, 255))),
+             2: ('/b.png', Image.new('RGBA', (40, 40), (0, 0, 255, 128))),
+             3: ('/a.png', Image.new('RGBA', (40, 40), (255, 0, 0, 255)))}
+    write_perk_atlas(str(tmp_path / 'atlas.bin'), 'md5', icons)
+    atlas = PerkAtlas(str(tmp_path / 'atlas.bin'))
+
+    assert atlas.manifest_md5 == 'md5'
+    for perk_hash, (icon_path, icon) in icons.items():
+        assert atlas.get_icon(perk_hash, icon_path).tobytes() == icon.tobytes()
+    # icons changed since the atlas was built are not served
+    assert atlas.get_icon(2, '/c.png') is None
+    assert atlas.get_icon(4, '/a.png') is None
+
+
+def test_catalog_snapshot_is_keyed_to_the_manifest(tmp_path):
+    catalog = Catalog()
+    catalog.names = {'fatebringer': 1}
+    catalog.perks = {2: ('Explosive Payload', '/icon.png', 'Trait')}
+    catalog.damage_types = {3: '/kinetic.png'}
+    catalog.god_rolls = {1: ([[2]], [])}
+    save_snapshot(catalog, 'md5', str(tmp_path / 'catalog.bin'))
+
+    loaded = load_snapshot('md5', 7, str(tmp_path / 'catalog.bin'))
+    assert (loaded.names, loaded.perks, loaded.damage_types) == (catalog.names, catalog.perks, catalog.damage_types)
+    assert loaded.generation == 7
+    # curated rolls are loaded separately
+    assert loaded.god_rolls == {}
+    assert load_snapshot('other md5', 7, str(tmp_path / 'catalog.bin')) is None
+
+
+@pytest.fixture
+def served_manifest(tmp_path):
+    manifest_path = tmp_path / 'served.content'
+    # incompressible and larger than a download chunk
+    manifest_path.write_bytes(random.Random(0).randbytes(3 * APIrequests.CHUNK_SIZE))
+    server, root = start_stand_in(str(manifest_path))
+    yield server, root, server.RequestHandlerClass.archive.get_content_path()
+    server.shutdown()
+
+
+def test_download_resumes_partial_file(tmp_path, served_manifest):
+    server, root, content_path = served_manifest
+    archive: bytes = open(server.RequestHandlerClass.archive.zip_path, 'rb').read()
+    part = tmp_path / 'MANZIP.part'
+    # a prefix the server did not send shows that only the rest was requested
+    part.write_bytes(b'x' * 1000)
+    download_file(root + content_path, str(part))
+
+    assert part.read_bytes() == b'x' * 1000 + archive[1000:]
+
+
+def test_download_restarts_if_server_ignores_range(tmp_path, served_manifest):
+    server, root, content_path = served_manifest
+    server.RequestHandlerClass.ranges = False
+    archive: bytes = open(server.RequestHandlerClass.archive.zip_path, 'rb').read()
+    part = tmp_path / 'MANZIP.part'
+    part.write_bytes(b'x' * 1000)
+    download_file(root + content_path, str(part))
+
+    assert part.read_bytes() == archive
+
+
+def test_complete_download_is_kept(tmp_path, served_manifest):
+    server, root, content_path = served_manifest
+    archive: bytes = open(server.RequestHandlerClass.archive.zip_path, 'rb').read()
+    part = tmp_path / 'MANZIP.part'
+    part.write_bytes(archive)
+    download_file(root + content_path, str(part))
+
+    assert part.read_bytes() == archive
+
+
+def test_manifest_with_wrong_md5_is_discarded(tmp_path, served_manifest, monkeypatch):
+    server, root, content_path = served_manifest
+    monkeypatch.setattr(APIrequests, 'BUNGIE_ROOT', root)
+    monkeypatch.setattr(APIrequests, 'STAGING_DIR', str(tmp_path / 'staging'))
+    monkeypatch.setattr(APIrequests, 'MANIFEST_PATH', str(tmp_path / 'Manifest.content'))
+
+    with pytest.raises(InvalidManifestError):
+        install_manifest(content_path, '0' * 32)
+    assert not os.path.exists(tmp_path / 'staging' / ('0' * 32))
+    assert not os.path.exists(tmp_path / 'Manifest.content')
+
+
+def test_corrupt_archive_is_rejected(tmp_path, served_manifest, monkeypatch):
+    server, root, content_path = served_manifest
+    monkeypatch.setattr(APIrequests, 'BUNGIE_ROOT', root)
+
+    staging_dir = tmp_path / 'staging'
+    staging_dir.mkdir()
+    # the stand-in answers with an image
+    with pytest.raises(InvalidManifestError):
+        download_manifest('/corrupt.png', str(staging_dir), '0' * 32)
+    assert os.listdir(staging_dir) == []
+
+
+def test_incremental_weapon_index_matches_full_build(tmp_path):
+    old_path, new_path, full_path = (str(tmp_path / name) for name in ('old.content', 'new.content', 'full.content'))
+    generate(old_path, scale=0.05)
+    build_weapon_index(old_path)
+    shutil.copy(old_path, new_path)
+
+    con = sqlite3.connect(new_path)
+    weapons: dict[int, dict] = {weapon_hash: json.loads(json_string) for weapon_hash, json_string in con.execute("""
+        SELECT WeaponNameIndex.hash, json FROM WeaponNameIndex JOIN DestinyInventoryItemDefinition USING (id)
+        WHERE random_roll = 1 ORDER BY id""")}
+    plug_sets: dict[int, set[int]] = {}
+    for json_string, in con.execute('SELECT json FROM DestinyPlugSetDefinition'):
+        plug_set: dict = json.loads(json_string)
+        plug_sets[plug_set['hash']] = {plug['plugItemHash'] for plug in plug_set['reusablePlugItems']}
+
+    def get_plug_sets(weapon: dict) -> list[set[int]]:
+        return [plug_sets[socket[key]] for socket in weapon['sockets']['socketEntries']
+                for key in ('randomizedPlugSetHash', 'reusablePlugSetHash') if key in socket]
+
+    removed_hash: int = next(iter(weapons))
+    renamed_hash: int = min(get_plug_sets(weapons[list(weapons)[-1]])[0])
+    with con:
+        con.execute('DELETE FROM DestinyInventoryItemDefinition WHERE id = ?', (hash_to_id(removed_hash),))
+        con.execute("""UPDATE DestinyInventoryItemDefinition SET json = json_set(json, '$.displayProperties.name', ?)
+                       WHERE id = ?""", ('Renamed Perk', hash_to_id(renamed_hash)))
+    con.close()
+
+    diff = update_weapon_index(new_path, old_path)
+    perk_users: set[int] = {weapon_hash for weapon_hash, weapon in weapons.items()
+                            if any(renamed_hash in plug_set for plug_set in get_plug_sets(weapon))}
+    assert set(diff.changed_weapons) == perk_users | {removed_hash}
+
+    shutil.copy(new_path, full_path)
+    build_weapon_index(full_path)
+    index_rows: list[list[tuple]] = []
+    for path in (new_path, full_path):
+        con = sqlite3.connect(path)
+        index_rows.append(con.execute('SELECT * FROM WeaponNameIndex ORDER BY id').fetchall())
+        con.close()
+    assert index_rows[0] == index_rows[1]
+
+
+def test_asset_cache_limit_holds_across_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(assetCache, 'RECOUNT_INTERVAL', 0)
+    # one cache per process writing to the same directory
+    caches = [AssetCache(str(tmp_path), max_bytes=10_000) for _ in range(2)]
+    in_progress = tmp_path / 'other_writer.part'
+    in_progress.write_bytes(b'0' * 1000)
+    for i in range(20):
+        caches[i % 2].put(f'/asset{i}.png', b'0' * 1000)
+        # overwriting a file does not grow the cache
+        caches[i % 2].put(f'/asset{i}.png', b'0' * 1000)
+
+    cached: list[str] = [name for name in os.listdir(tmp_path) if not name.endswith('.part')]
+    assert len(cached) <= 10
+    assert in_progress.exists()
@@ -0,0 +1,185 @@
+import bisect
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from itertools import chain
+from typing import Optional
+from manifestIndex import WEAPON_INDEX_TABLE, normalize_name
+
+# discord shows at most 25 autocomplete choices
+MAX_SUGGESTIONS = 25
+MAX_FUZZY_SUGGESTIONS = 5
+# trigram similarity a name needs to be suggested for a misspelled request
+SUGGEST_SIMILARITY = 0.3
+# a misspelled request resolves to the closest name if it is this similar and clearly ahead of the runner-up
+RESOLVE_SIMILARITY = 0.6
+RESOLVE_MARGIN = 0.1
+
+
+def get_trigrams(name: str) -> set[str]:
+    """
+    :param name: normalized name
+    :return: all 3 character substrings of the name, padded so that its beginning weighs more
+    """
+    padded: str = f'  {name} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class WeaponSearchIndex:
+    """
+    In-memory index over the names of all random rolled weapons for lookups that must not touch the database,
+    e.g. autocomplete callbacks that fire on every keystroke.
+    """
+    names: list[str]
+    normalized_names: list[str]
+    prefixes: list[tuple[str, int]]
+    trigrams: dict[str, list[int]]
+    trigram_counts: list[int]
+    min_trigram_count: int
+    generation: int
+
+    def __init__(self, names: list[str], generation: int = -1):
+        """
+        :param names: display names of the random rolled weapons
+        :param generation: manifest connection pool generation the names were read from
+        """
+        self.names = sorted(set(names), key=normalize_name)
+        self.normalized_names = [normalize_name(name) for name in self.names]
+        self.generation = generation
+
+        # every word of a name starts a key, so "horizon" completes "Astral Horizon" as well
+        self.prefixes = []
+        for i, name in enumerate(self.normalized_names):
+            words: list[str] = name.split(' ')
+            for j in range(len(words)):
+                self.prefixes.append((' '.join(words[j:]), i))
+        self.prefixes.sort()
+
+        self.trigrams = {}
+        self.trigram_counts = []
+        for i, name in enumerate(self.normalized_names):
+            name_trigrams: set[str] = get_trigrams(name)
+            self.trigram_counts.append(len(name_trigrams))
+            for trigram in name_trigrams:
+                self.trigrams.setdefault(trigram, []).append(i)
+        self.min_trigram_count = min(self.trigram_counts, default=0)
+
+    def complete(self, text: str, limit: int = MAX_SUGGESTIONS) -> list[str]:
+        """
+        :param text: partial weapon name as typed by the user
+        :param limit: maximum number of names to return
+        :return: names starting with the text, followed by names containing a word starting with the text
+        """
+        prefix: str = normalize_name(text)
+        name_matches: list[int] = []
+        word_matches: list[int] = []
+
+        i: int = bisect.bisect_left(self.prefixes, (prefix,))
+        while i < len(self.prefixes) and len(name_matches) < limit:
+            key, name_index = self.prefixes[i]
+            if not key.startswith(prefix):
+                break
+            if self.normalized_names[name_index] == key:
+                name_matches.append(name_index)
+            elif len(word_matches) < limit:
+                word_matches.append(name_index)
+            i += 1
+
+        matches: dict[int, None] = dict.fromkeys(sorted(name_matches))
+        matches.update(dict.fromkeys(sorted(word_matches)))
+        return [self.names[name_index] for name_index in matches][:limit]
+
+    def find_similar(self, text: str, limit: int = MAX_FUZZY_SUGGESTIONS,
+                     min_similarity: float = SUGGEST_SIMILARITY) -> list[tuple[str, float]]:
+        """
+        ranks names by the share of trigrams they have in common with the text (Dice coefficient)
+
+        :param text: possibly misspelled weapon name
+        :param limit: maximum number of names to return
+        :param min_similarity: similarity between 0 and 1 a name needs at least
+        :return: names and their similarity, most similar first
+        """
+        text_trigrams: set[str] = get_trigrams(normalize_name(text))
+        # only names sharing at least one trigram are looked at
+        shared: Counter = Counter(chain.from_iterable(self.trigrams.get(trigram, ()) for trigram in text_trigrams))
+
+        # min-heap of the best (similarity, -name index) so far, ties go to the name sorted first
+        best: list[tuple[float, int]] = []
+        for name_index, count in shared.most_common():
+            # names further down share fewer trigrams and can at best be as similar as the shortest name would be
+            if len(best) == limit and 2 * count / (len(text_trigrams) + self.min_trigram_count) <= best[0][0]:
+                break
+            score: tuple[float, int] = (2 * count / (len(text_trigrams) + self.trigram_counts[name_index]), -name_index)
+            if len(best) < limit:
+                heapq.heappush(best, score)
+            elif score > best[0]:
+                heapq.heapreplace(best, score)
+
+        return [(self.names[-name_index], similarity) for similarity, name_index in sorted(best, reverse=True)
+                if similarity >= min_similarity]
+
+    def correct(self, text: str) -> Optional[str]:
+        """
+        :param text: misspelled weapon name
+        :return: the name the text most likely meant, None if no name is close enough or several are
+        """
+        matches: list[tuple[str, float]] = self.find_similar(text, limit=2, min_similarity=RESOLVE_SIMILARITY)
+        if not matches:
+            return None
+        if len(matches) > 1 and matches[0][1] - matches[1][1] < RESOLVE_MARGIN:
+            return None
+        return matches[0][0]
+
+
+def build_search_index(con: sqlite3.Connection, generation: int = -1) -> WeaponSearchIndex:
+    """
+    :param con: connection to the game database
+    :param generation: manifest connection pool generation of con
+    :return: index over the random rolled weapons of the game database
+    """
+    names: list[str] = [row[0] for row in con.execute(
+        f'SELECT DISTINCT display_name FROM {WEAPON_INDEX_TABLE} WHERE random_roll = 1')]
+    return WeaponSearchIndex(names, generation)
+
+
+_search_index: WeaponSearchIndex = WeaponSearchIndex([])
+_search_index_lock = threading.Lock()
+
+
+def get_search_index() -> WeaponSearchIndex:
+    """
+    never blocks; the index may lag behind a manifest update until refresh_search_index() ran
+
+    :return: the most recently built index, empty before the first build
+    """
+    return _search_index
+
+
+def refresh_search_index() -> WeaponSearchIndex:
+    """
+    (re)builds the index if it was not built from the currently installed game database yet
+
+    :return: the current index
+    """
+    global _search_index
+    from readDB import manifest_pool
+
+    with _search_index_lock:
+        generation: int = manifest_pool.generation
+        if _search_index.generation != generation:
+            start: float = time.perf_counter()
+            _search_index = build_search_index(manifest_pool.get_connection(), generation)
+            logging.info(f'weapon search index built in {time.perf_counter() - start:.3f}s; '
+                         f'{len(_search_index.names)} weapons')
+        return _search_index
+
+
+def complete_weapon_name(text: str) -> list[str]:
+    """
+    :param text: partial weapon name as typed by the user
+    :return: up to MAX_SUGGESTIONS random rolled weapon names matching the text
+    """
+    return get_search_index().complete(text)
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
+from createImages import preload_templates
+
+# 0 renders on the DB threads instead, e.g. on hosts that can not spare the memory for worker processes
+RENDER_PROCESSES: int = int(os.environ.get('RAHOOL_RENDER_PROCESSES', os.cpu_count() or 1))
+DB_THREADS: int = int(os.environ.get('RAHOOL_DB_THREADS', 8))
+
+T = TypeVar('T')
+
+db_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='rahool-db')
+_render_executor: Optional[ProcessPoolExecutor] = None
+_render_lock = threading.Lock()
+
+
+def get_render_executor() -> Executor:
+    """
+    :return: the process pool that renders images, started on first use, or the DB thread pool
+    if RENDER_PROCESSES is 0
+    """
+    global _render_executor
+    if RENDER_PROCESSES <= 0:
+        return db_executor
+
+    with _render_lock:
+        if _render_executor is None:
+            # forkserver workers do not inherit the bot's threads, locks and open database connections
+            # workers load the fonts and build the render templates once, before their first render
+            _render_executor = ProcessPoolExecutor(max_workers=RENDER_PROCESSES,
+                                                   mp_context=multiprocessing.get_context('forkserver'),
+                                                   initializer=preload_templates)
+            logging.info(f'render pool started with {RENDER_PROCESSES} processes')
+        return _render_executor
+
+
+async def run_blocking(func: Callable[..., T], *args) -> T:
+    """
+    runs a blocking function, e.g. a database query, on the DB thread pool
+
+    :param func: function to run
+    :param args: positional arguments of the function
+    :return: the function's return value
+    """
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+
+async def run_render(func: Callable[..., T], *args) -> T:
+    """
+    runs a CPU-bound function on the render pool; arguments and return value must be picklable
+
+    :param func: module-level function to run
+    :param args: positional arguments of the function
+    :return: the function's return value
+    :raises BrokenProcessPool: if a worker died, the pool is replaced for subsequent calls
+    """
+    global _render_executor
+    executor: Executor = get_render_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        logging.error('a render process died; restarting the render pool')
+        with _render_lock:
+            if _render_executor is executor:
+                _render_executor = None
+        executor.shutdown(wait=False)
+        raise
+
+
+def shutdown_pools():
+    """
+    stops all worker threads and processes
+    """
+    global _render_executor
+    with _render_lock:
+        if _render_executor is not None:
+            _render_executor.shutdown(cancel_futures=True)
+            _render_executor = None
+    db_executor.shutdown(cancel_futures=True)